@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Ingredient, Recipe, RecipeIngredient, UserRecipeHistory
+from .models import Ingredient, IngredientAlias, IngredientSubstitution, QuotaBucket, Recipe, RecipeIngredient, UserRecipeHistory
 
 
 class RecipeIngredientInline(admin.TabularInline):
@@ -7,12 +7,25 @@ class RecipeIngredientInline(admin.TabularInline):
     extra = 1
 
 
+class IngredientAliasInline(admin.TabularInline):
+    model = IngredientAlias
+    extra = 1
+
+
+class IngredientSubstitutionInline(admin.TabularInline):
+    model = IngredientSubstitution
+    fk_name = 'ingredient'
+    autocomplete_fields = ['substitute']
+    extra = 1
+
+
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ['name', 'category']
     list_filter = ['category']
-    search_fields = ['name']
+    search_fields = ['name', 'aliases__alias']
     ordering = ['name']
+    inlines = [IngredientAliasInline, IngredientSubstitutionInline]
 
 
 @admin.register(Recipe)
@@ -20,7 +33,7 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = ['title', 'cuisine', 'difficulty', 'cooking_time', 'is_generated', 'created_at']
     list_filter = ['cuisine', 'difficulty', 'is_generated', 'created_at']
     search_fields = ['title', 'description', 'instructions']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['spoonacular_id', 'imported_at', 'created_at', 'updated_at']
     inlines = [RecipeIngredientInline]
     ordering = ['-created_at']
 
@@ -39,3 +52,8 @@ class UserRecipeHistoryAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'recipe__title']
     readonly_fields = ['created_at']
     ordering = ['-created_at']
+
+
+@admin.register(QuotaBucket)
+class QuotaBucketAdmin(admin.ModelAdmin):
+    list_display = ['name', 'tokens', 'refilled_at']
@@ -0,0 +1,126 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from apps.recipes.models import Recipe
+from apps.recipes.services.index import IngredientIndex
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the recipe matcher on synthetic catalogs of growing size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000,1000000',
+                            help='Comma-separated catalog sizes to benchmark')
+        parser.add_argument('--queries', type=int, default=50, help='Queries per catalog size')
+        parser.add_argument('--ingredients', type=int, default=2000, help='Size of the ingredient vocabulary')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--skip-baseline', action='store_true',
+                            help='Do not time the per-recipe posting loop for comparison')
+        parser.add_argument('--lsh', default='16x2,32x2,64x3',
+                            help='Comma-separated BANDSxROWS MinHash LSH settings to compare, empty to skip')
+        parser.add_argument('--k', type=int, default=5, help='Matches ranked per query when measuring LSH recall')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = list(range(1, options['ingredients'] + 1))
+        # Zipf-like popularity so that a few ingredients (salt, onion...) are everywhere
+        cum_weights = []
+        total = 0.0
+        for rank in range(len(vocabulary)):
+            total += 1 / (rank + 1) ** 0.9
+            cum_weights.append(total)
+        cuisines = [code for code, _ in Recipe.CUISINE_CHOICES]
+
+        self.stdout.write(f'{"recipes":>10} {"build s":>9} {"p50 ms":>9} {"p95 ms":>9} {"loop p50 ms":>12}')
+        for size in [int(value) for value in options['sizes'].split(',')]:
+            rows = [
+                (recipe_id, rng.choice(cuisines), rng.choice([10, 15, 20, 30, 45, 60, 90]),
+                 rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(5, 15)))
+                for recipe_id in range(1, size + 1)
+            ]
+            queries = [
+                (rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(2, 8)), rng.choice(cuisines + [None]))
+                for _ in range(options['queries'])
+            ]
+
+            started = time.perf_counter()
+            index = IngredientIndex.from_rows(rows)
+            build_time = time.perf_counter() - started
+
+            timings = []
+            for selected, cuisine in queries:
+                started = time.perf_counter()
+                index.best_match(selected, cuisine)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            baseline = '-'
+            if not options['skip_baseline']:
+                baseline = f'{statistics.median(self._time_loop(rows, queries)):12.2f}'
+
+            self.stdout.write(
+                f'{size:>10} {build_time:9.2f} {statistics.median(timings):9.2f} {self._p95(timings):9.2f} {baseline:>12}'
+            )
+            if options['lsh']:
+                self._compare_lsh(index, queries, options['lsh'], options['k'])
+
+    def _p95(self, timings):
+        timings = sorted(timings)
+        return timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+
+    def _compare_lsh(self, index, queries, configs, k):
+        """Time the exact top k against MinHash LSH shortlists and report recall@k"""
+        exact_results = []
+        exact_timings = []
+        for selected, cuisine in queries:
+            started = time.perf_counter()
+            exact_results.append({recipe_id for recipe_id, _, _ in index.top_matches(selected, cuisine, k)})
+            exact_timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(
+            f'{"":>10} exact top {k}: p50 {statistics.median(exact_timings):.2f} ms, p95 {self._p95(exact_timings):.2f} ms'
+        )
+
+        for config in configs.split(','):
+            bands, rows = (int(value) for value in config.lower().split('x'))
+            started = time.perf_counter()
+            lsh = index.enable_lsh(bands, rows)
+            build_time = time.perf_counter() - started
+
+            timings = []
+            shortlists = []
+            found = expected = 0
+            for (selected, cuisine), exact in zip(queries, exact_results):
+                started = time.perf_counter()
+                approximate = index.approximate_matches(selected, cuisine, k)
+                timings.append((time.perf_counter() - started) * 1000)
+                shortlists.append(len(lsh.candidates(selected)))
+                found += len(exact.intersection(recipe_id for recipe_id, _, _ in approximate))
+                expected += len(exact)
+            recall = found / expected if expected else 1.0
+            self.stdout.write(
+                f'{"":>10} lsh {bands}x{rows}: build {build_time:.2f} s, p50 {statistics.median(timings):.2f} ms, '
+                f'p95 {self._p95(timings):.2f} ms, shortlist p50 {statistics.median(shortlists):.0f}, '
+                f'recall@{k} {recall:.3f}'
+            )
+
+    def _time_loop(self, rows, queries):
+        """Time the previous approach: count postings recipe by recipe in Python"""
+        postings = {}
+        for recipe_id, cuisine, cooking_time, ingredient_ids in rows:
+            for ingredient_id in set(ingredient_ids):
+                postings.setdefault(ingredient_id, []).append((recipe_id, cuisine))
+        totals = {recipe_id: (len(set(ingredient_ids)), cooking_time)
+                  for recipe_id, _, cooking_time, ingredient_ids in rows}
+
+        timings = []
+        for selected, cuisine in queries:
+            started = time.perf_counter()
+            matching = {}
+            for ingredient_id in set(selected):
+                for recipe_id, recipe_cuisine in postings.get(ingredient_id, ()):
+                    if cuisine is None or recipe_cuisine == cuisine:
+                        matching[recipe_id] = matching.get(recipe_id, 0) + 1
+            min(((-count, totals[recipe_id][0] - count, totals[recipe_id][1], -recipe_id)
+                 for recipe_id, count in matching.items()), default=None)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
@@ -0,0 +1,40 @@
+import random
+from django.core.management.base import BaseCommand, CommandError
+from apps.recipes.models import Recipe, RecipeIngredient
+from apps.recipes.services.generator import match_recipes
+
+
+class Command(BaseCommand):
+    help = 'Check that the index and database matcher backends return the same rankings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200, help='Number of random selections to compare')
+        parser.add_argument('--k', type=int, default=5, help='Number of ranked matches to compare per query')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Sample from ingredients that are actually used so most queries have matches
+        ingredient_ids = list(RecipeIngredient.objects.values_list('ingredient_id', flat=True).distinct())
+        if not ingredient_ids:
+            raise CommandError('No recipe ingredients to compare against')
+        cuisines = [code for code, _ in Recipe.CUISINE_CHOICES] + [None]
+
+        mismatches = 0
+        for _ in range(options['queries']):
+            selected = rng.sample(ingredient_ids, min(len(ingredient_ids), rng.randint(1, 8)))
+            cuisine = rng.choice(cuisines)
+            from_index = self._summary(match_recipes(selected, cuisine, options['k'], backend='index'))
+            from_database = self._summary(match_recipes(selected, cuisine, options['k'], backend='database'))
+            if from_index != from_database:
+                mismatches += 1
+                self.stdout.write(self.style.WARNING(
+                    f'Mismatch for {sorted(selected)} ({cuisine}): index={from_index} database={from_database}'
+                ))
+
+        if mismatches:
+            raise CommandError(f'{mismatches} of {options["queries"]} queries differ between backends')
+        self.stdout.write(self.style.SUCCESS(f'✅ {options["queries"]} queries ranked identically by both backends'))
+
+    def _summary(self, matches):
+        return [(match.recipe.id, match.matching, match.missing, match.substitutable) for match in matches]
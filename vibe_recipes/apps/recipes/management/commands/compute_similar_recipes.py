@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from apps.recipes.models import Recipe, SimilarRecipe
+from apps.recipes.services.index import IngredientIndex
+from apps.recipes.services.similarity import compute_neighbors, refresh_similar_recipes, store_neighbors
+
+
+class Command(BaseCommand):
+    help = 'Precompute the most ingredient-similar recipes of every recipe for the detail page'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true',
+                            help='Only compute recipes without stored neighbors, merging them into existing lists')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Recipes whose neighbors are written per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['missing']:
+            recipe_ids = list(
+                Recipe.objects.exclude(id__in=SimilarRecipe.objects.values('recipe_id')).order_by('id').values_list('id', flat=True)
+            )
+            for start in range(0, len(recipe_ids), batch_size):
+                refresh_similar_recipes(recipe_ids[start:start + batch_size])
+            self.stdout.write(self.style.SUCCESS(f'🎉 Computed similar recipes for {len(recipe_ids)} recipes without any'))
+            return
+
+        index = IngredientIndex.build()
+        recipe_ids = sorted(index.row_of)
+        linked = 0
+        for start in range(0, len(recipe_ids), batch_size):
+            neighbors = compute_neighbors(index, recipe_ids[start:start + batch_size])
+            store_neighbors(neighbors)
+            linked += sum(len(similar) for similar in neighbors.values())
+            self.stdout.write(f'   {min(start + batch_size, len(recipe_ids))}/{len(recipe_ids)} recipes')
+
+        self.stdout.write(self.style.SUCCESS(f'🎉 Stored {linked} similar recipe links for {len(recipe_ids)} recipes'))
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from apps.community.models import CommunityPost
+from apps.recipes.models import Recipe, RecipeIngredient, UserRecipeHistory
+from apps.recipes.services.generator import recipe_fingerprint
+
+
+class Command(BaseCommand):
+    help = 'Collapse duplicate synthesized recipes and fingerprint the survivors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report duplicates without changing anything')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        # Synthesized recipes are either fingerprinted already or carry the
+        # description synthesize_recipe writes (Spoonacular imports do not)
+        recipes = list(
+            Recipe.objects.filter(
+                Q(fingerprint__isnull=False) | Q(description__regex=r'^A delicious \w+ recipe made with '),
+                is_generated=True,
+            ).order_by('id').values_list('id', 'cuisine', 'fingerprint')
+        )
+
+        ingredients_by_recipe = {}
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=[recipe_id for recipe_id, _, _ in recipes]
+        ).values_list('recipe_id', 'ingredient_id'):
+            ingredients_by_recipe.setdefault(recipe_id, set()).add(ingredient_id)
+
+        groups = {}
+        for recipe_id, cuisine, current_fingerprint in recipes:
+            fingerprint = recipe_fingerprint(ingredients_by_recipe.get(recipe_id, set()), cuisine)
+            groups.setdefault(fingerprint, []).append((recipe_id, current_fingerprint))
+
+        removed = 0
+        fingerprinted = 0
+        for fingerprint, members in groups.items():
+            # Keep the recipe already holding the fingerprint, otherwise the oldest one
+            keeper_id = next((recipe_id for recipe_id, current in members if current == fingerprint), members[0][0])
+            duplicate_ids = [recipe_id for recipe_id, _ in members if recipe_id != keeper_id]
+            needs_fingerprint = dict(members)[keeper_id] != fingerprint
+            if not duplicate_ids and not needs_fingerprint:
+                continue
+
+            if duplicate_ids:
+                self.stdout.write(f'🔁 Recipe {keeper_id} replaces duplicates {duplicate_ids}')
+            removed += len(duplicate_ids)
+            fingerprinted += needs_fingerprint
+            if dry_run:
+                continue
+
+            with transaction.atomic():
+                UserRecipeHistory.objects.filter(recipe_id__in=duplicate_ids).update(recipe_id=keeper_id)
+                CommunityPost.objects.filter(recipe_id__in=duplicate_ids).update(recipe_id=keeper_id)
+                Recipe.objects.filter(id__in=duplicate_ids).delete()
+                if needs_fingerprint:
+                    # A stale fingerprint on another recipe would break the unique index
+                    Recipe.objects.filter(fingerprint=fingerprint).exclude(id=keeper_id).update(fingerprint=None)
+                    Recipe.objects.filter(id=keeper_id).update(fingerprint=fingerprint)
+
+        verb = 'Would remove' if dry_run else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'🎉 {verb} {removed} duplicate recipes and fingerprint {fingerprinted} recipes'
+        ))
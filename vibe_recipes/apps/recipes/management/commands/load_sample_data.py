@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from apps.recipes.models import Ingredient, Recipe
+from apps.recipes.services.substitutions import seed_default_substitutions
 
 class Command(BaseCommand):
     help = 'Load sample data for the recipe generator'
@@ -128,6 +129,10 @@ class Command(BaseCommand):
                 
                 self.stdout.write(f'✅ Created recipe: {recipe_data["title"]}')
         
+        # Substitutions link ingredients by name, so they can only be seeded once those exist
+        edges = seed_default_substitutions()
+        self.stdout.write(f'🔁 Seeded {edges} ingredient substitutions')
+        
         self.stdout.write(self.style.SUCCESS('🎉 Sample data loaded successfully!'))
         self.stdout.write(f'📊 Created {Ingredient.objects.count()} ingredients with categories')
         self.stdout.write(f'📊 Created {Recipe.objects.count()} recipes')
@@ -0,0 +1,120 @@
+from collections import Counter
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from apps.recipes.models import Ingredient, IngredientAlias, IngredientSubstitution, RecipeIngredient, UserRecipeHistory
+from apps.recipes.services.index import batch_catalog_changes, record_catalog_change
+from apps.recipes.services.ingredients import get_ingredient_resolver, normalize_ingredient_name
+
+
+class Command(BaseCommand):
+    help = 'Merge ingredients whose names normalize alike into one, keeping the others as aliases'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report duplicates without changing anything')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        usage = Counter(RecipeIngredient.objects.values_list('ingredient_id', flat=True))
+
+        groups = {}
+        for ingredient in Ingredient.objects.order_by('id'):
+            groups.setdefault(normalize_ingredient_name(ingredient.name), []).append(ingredient)
+
+        replacements = {}
+        for key, members in groups.items():
+            if len(members) < 2 or not key:
+                continue
+            # Keep the most used ingredient, the oldest one on ties
+            keeper = max(members, key=lambda ingredient: (usage[ingredient.id], -ingredient.id))
+            duplicates = [ingredient for ingredient in members if ingredient.id != keeper.id]
+            self.stdout.write(
+                f'🔁 {keeper.name} ({keeper.id}) absorbs {", ".join(f"{d.name} ({d.id})" for d in duplicates)}'
+            )
+            for duplicate in duplicates:
+                replacements[duplicate.id] = keeper
+
+        if dry_run or not replacements:
+            verb = 'Would merge' if dry_run else 'Merged'
+            self.stdout.write(self.style.SUCCESS(f'🎉 {verb} {len(replacements)} duplicate ingredients'))
+            return
+
+        with transaction.atomic(), batch_catalog_changes():
+            affected_recipes = self._relink_recipes(replacements)
+            history_updated = self._rewrite_history(replacements)
+
+            # Existing aliases move over and the merged names become aliases too
+            aliases = []
+            for duplicate in Ingredient.objects.filter(id__in=replacements):
+                keeper = replacements[duplicate.id]
+                IngredientAlias.objects.filter(ingredient=duplicate).update(ingredient=keeper)
+                alias = duplicate.name.strip().lower()
+                if alias != keeper.name.strip().lower():
+                    aliases.append(IngredientAlias(alias=alias, ingredient=keeper))
+            IngredientAlias.objects.bulk_create(aliases, ignore_conflicts=True)
+            self._relink_substitutions(replacements)
+            Ingredient.objects.filter(id__in=replacements).delete()
+            # Queryset updates skip the signals that keep the matcher index current
+            record_catalog_change(affected_recipes)
+
+        get_ingredient_resolver().clear()
+        self.stdout.write(self.style.SUCCESS(
+            f'🎉 Merged {len(replacements)} duplicate ingredients across {len(affected_recipes)} recipes '
+            f'and {history_updated} history entries'
+        ))
+
+    def _relink_recipes(self, replacements):
+        """Point recipe rows at the kept ingredients, dropping rows a recipe would then hold twice"""
+        links = list(
+            RecipeIngredient.objects.filter(ingredient_id__in=replacements).values_list('id', 'recipe_id', 'ingredient_id')
+        )
+        affected_recipes = {recipe_id for _, recipe_id, _ in links}
+        held = set(RecipeIngredient.objects.filter(recipe_id__in=affected_recipes).exclude(
+            ingredient_id__in=replacements
+        ).values_list('recipe_id', 'ingredient_id'))
+
+        redundant = []
+        moves = {}
+        for link_id, recipe_id, ingredient_id in links:
+            keeper_id = replacements[ingredient_id].id
+            if (recipe_id, keeper_id) in held:
+                redundant.append(link_id)
+            else:
+                moves.setdefault(keeper_id, []).append(link_id)
+                held.add((recipe_id, keeper_id))
+        for keeper_id, link_ids in moves.items():
+            RecipeIngredient.objects.filter(id__in=link_ids).update(ingredient_id=keeper_id)
+        RecipeIngredient.objects.filter(id__in=redundant).delete()
+        return affected_recipes
+
+    def _relink_substitutions(self, replacements):
+        """Copy substitution edges onto the kept ingredients; the originals go with the duplicates"""
+        edges = []
+        for ingredient_id, substitute_id, weight in IngredientSubstitution.objects.filter(
+            Q(ingredient_id__in=replacements) | Q(substitute_id__in=replacements)
+        ).values_list('ingredient_id', 'substitute_id', 'weight'):
+            ingredient_id = replacements[ingredient_id].id if ingredient_id in replacements else ingredient_id
+            substitute_id = replacements[substitute_id].id if substitute_id in replacements else substitute_id
+            if ingredient_id != substitute_id:
+                edges.append(IngredientSubstitution(ingredient_id=ingredient_id, substitute_id=substitute_id, weight=weight))
+        IngredientSubstitution.objects.bulk_create(edges, ignore_conflicts=True)
+
+    def _rewrite_history(self, replacements):
+        """Rewrite merged ids in stored selections so popularity stats stay accurate"""
+        changed = []
+        for history in UserRecipeHistory.objects.only('id', 'selected_ingredients').iterator():
+            selection = history.selected_ingredients
+            if not isinstance(selection, dict) or not selection.get('ingredients'):
+                continue
+            ingredient_ids = selection['ingredients']
+            if not any(ingredient_id in replacements for ingredient_id in ingredient_ids):
+                continue
+            rewritten = []
+            for ingredient_id in ingredient_ids:
+                ingredient_id = replacements[ingredient_id].id if ingredient_id in replacements else ingredient_id
+                if ingredient_id not in rewritten:
+                    rewritten.append(ingredient_id)
+            selection['ingredients'] = rewritten
+            changed.append(history)
+        UserRecipeHistory.objects.bulk_update(changed, ['selected_ingredients'], batch_size=500)
+        return len(changed)
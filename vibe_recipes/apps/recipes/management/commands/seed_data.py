@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from apps.recipes.models import Ingredient, Recipe, RecipeIngredient
+from apps.recipes.services.substitutions import seed_default_substitutions
 
 
 class Command(BaseCommand):
@@ -165,6 +166,9 @@ class Command(BaseCommand):
                 
                 self.stdout.write(f'Created recipe: {recipe.title}')
         
+        edges = seed_default_substitutions()
+        self.stdout.write(f'Seeded {edges} ingredient substitutions')
+        
         self.stdout.write(
             self.style.SUCCESS('Successfully seeded database!')
         )
@@ -0,0 +1,56 @@
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.recipes.services.spoonacular_stub import StubConfig, make_stub_server
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve a local stand-in for the Spoonacular recipe endpoints for offline benchmarks. '
+        'Run benchmarks against a scratch database: generate runs import the recipes the stub returns.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--mode', choices=['synthetic', 'replay', 'record'], default='synthetic',
+                            help='Answer from the local catalog, from recorded fixtures, or record misses upstream')
+        parser.add_argument('--fixtures', default=str(settings.BASE_DIR / 'spoonacular_fixtures'),
+                            help='Directory of recorded responses for replay/record')
+        parser.add_argument('--upstream', default='https://api.spoonacular.com/recipes',
+                            help='Real Spoonacular base URL used when recording')
+        parser.add_argument('--latency', type=float, default=0, help='Mean injected latency in ms')
+        parser.add_argument('--jitter', type=float, default=0, help='Standard deviation of the injected latency in ms')
+        parser.add_argument('--error-rate', type=float, default=0, help='Fraction of requests answered with an error')
+        parser.add_argument('--error-status', type=int, default=500, help='Status code of injected errors')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['error_rate'] <= 1:
+            raise CommandError('--error-rate must be between 0 and 1')
+
+        config = StubConfig(
+            mode=options['mode'],
+            fixtures_dir=Path(options['fixtures']),
+            upstream_url=options['upstream'].rstrip('/'),
+            latency_ms=options['latency'],
+            jitter_ms=options['jitter'],
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+        )
+        server = make_stub_server(options['host'], options['port'], config)
+        host, port = server.server_address[:2]
+        self.stdout.write(self.style.SUCCESS(f'🧪 Spoonacular stub ({config.mode}) listening on http://{host}:{port}'))
+        self.stdout.write(f'   Point the app at it with SPOONACULAR_BASE_URL=http://{host}:{port}/recipes')
+        if config.mode == 'synthetic':
+            self.stdout.write(self.style.WARNING(
+                '   Generate runs import what the stub returns: benchmark against a scratch database'
+            ))
+        if config.mode == 'record':
+            self.stdout.write('   Requests without a fixture are forwarded upstream with their API key and recorded')
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write('\n👋 Stub stopped')
+        finally:
+            server.server_close()
@@ -0,0 +1,64 @@
+from collections import Counter
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.recipes.models import UserRecipeHistory
+from apps.recipes.services.spoonacular import call_stats, create_recipe_from_spoonacular, get_api, get_spoonacular_recipes
+
+# Points a cold search costs: findByIngredients plus informationBulk for three candidates
+COLD_SEARCH_POINTS = 1.05 + 2
+
+
+class Command(BaseCommand):
+    help = 'Prefetch and import Spoonacular results for the most popular ingredient selections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='How far back to look at generate history')
+        parser.add_argument('--top', type=int, default=50, help='Number of popular selections to warm')
+        parser.add_argument('--budget', type=float, default=50, help='Most Spoonacular points to spend')
+        parser.add_argument('--no-import', action='store_true',
+                            help='Only warm the response cache, do not import the best recipe')
+        parser.add_argument('--dry-run', action='store_true', help='List the selections without fetching anything')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        popularity = Counter()
+        for selection in UserRecipeHistory.objects.filter(created_at__gte=since).values_list(
+            'selected_ingredients', flat=True
+        ).iterator():
+            if not isinstance(selection, dict) or not selection.get('ingredients') or not selection.get('cuisine'):
+                continue
+            popularity[(tuple(sorted(set(selection['ingredients']))), selection['cuisine'])] += 1
+
+        popular = popularity.most_common(options['top'])
+        self.stdout.write(f'📊 {len(popularity)} distinct selections in the last {options["days"]} days, warming {len(popular)}')
+        if options['dry_run']:
+            for (ingredient_ids, cuisine), count in popular:
+                self.stdout.write(f'   {count:>5}x {cuisine}: {list(ingredient_ids)}')
+            return
+
+        budget = min(options['budget'], get_api().quota.remaining())
+        # Only this command calls Spoonacular in this process, so the charges it records are exactly our spend
+        # (the shared quota's level also moves with refill and other workers)
+        spent_before = call_stats.points_spent()
+        spent = 0.0
+        warmed = imported = 0
+        for (ingredient_ids, cuisine), count in popular:
+            # Stop before a cold search could overrun the budget
+            if spent + COLD_SEARCH_POINTS > budget:
+                self.stdout.write(self.style.WARNING(f'⏸️ Stopping after {warmed} selections, budget of {budget:.2f} points reached'))
+                break
+
+            recipes = get_spoonacular_recipes(list(ingredient_ids), cuisine)
+            spent = call_stats.points_spent() - spent_before
+            if not recipes:
+                continue
+
+            warmed += 1
+            if not options['no_import']:
+                create_recipe_from_spoonacular(recipes[0], list(ingredient_ids))
+                imported += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'🔥 Warmed {warmed} selections and imported {imported} recipes for {spent:.2f} points'
+        ))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='imported_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='spoonacular_id',
+            field=models.IntegerField(blank=True, null=True, unique=True),
+        ),
+    ]
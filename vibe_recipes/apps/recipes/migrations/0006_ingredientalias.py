@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_quotabucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=100, unique=True)),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='recipes.ingredient')),
+            ],
+            options={
+                'verbose_name_plural': 'Ingredient aliases',
+                'ordering': ['alias'],
+            },
+        ),
+    ]
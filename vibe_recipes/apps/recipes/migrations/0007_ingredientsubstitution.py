@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_ingredientalias'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientSubstitution',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weight', models.FloatField(default=1.0)),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='substitutions', to='recipes.ingredient')),
+                ('substitute', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='substitute_for', to='recipes.ingredient')),
+            ],
+            options={
+                'ordering': ['ingredient__name', '-weight'],
+                'unique_together': {('ingredient', 'substitute')},
+            },
+        ),
+    ]
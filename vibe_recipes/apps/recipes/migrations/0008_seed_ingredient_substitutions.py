@@ -0,0 +1,53 @@
+from django.db import migrations
+
+# Frozen copy of the default swaps at the time of this migration, better
+# options first; later edits to the service's list must not change it
+SUBSTITUTIONS = {
+    'cream': ['milk', 'butter'],
+    'milk': ['cream', 'yogurt'],
+    'butter': ['olive oil', 'vegetable oil'],
+    'beef': ['mushroom', 'tofu', 'lentils'],
+    'chicken': ['tofu', 'mushroom', 'chickpeas'],
+    'eggs': ['flax seeds', 'banana'],
+    'cheese': ['nutritional yeast', 'tofu'],
+    'garlic': ['garlic powder', 'onion'],
+    'onion': ['garlic', 'shallot'],
+    'tomato': ['bell pepper', 'carrot'],
+    'pasta': ['rice', 'quinoa'],
+    'rice': ['quinoa', 'couscous'],
+    'bread': ['tortilla', 'lettuce'],
+}
+
+
+def seed_substitutions(apps, schema_editor):
+    """Link the default substitutions whose ingredients exist in the catalog"""
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientSubstitution = apps.get_model('recipes', 'IngredientSubstitution')
+
+    ids = {}
+    for ingredient_id, name in Ingredient.objects.order_by('-id').values_list('id', 'name'):
+        ids[name.strip().lower()] = ingredient_id
+
+    edges = []
+    for name, substitutes in SUBSTITUTIONS.items():
+        if name not in ids:
+            continue
+        for position, substitute in enumerate(substitutes):
+            if substitute in ids:
+                edges.append(IngredientSubstitution(
+                    ingredient_id=ids[name],
+                    substitute_id=ids[substitute],
+                    weight=round(0.9 - 0.1 * position, 2),
+                ))
+    IngredientSubstitution.objects.bulk_create(edges, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_ingredientsubstitution'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_substitutions, migrations.RunPython.noop),
+    ]
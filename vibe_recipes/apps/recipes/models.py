@@ -13,6 +13,41 @@ class Ingredient(models.Model):
         ordering = ['name']
 
 
+class IngredientAlias(models.Model):
+    """
+    Another name for an ingredient, e.g. a synonym ("scallion" for "green
+    onion") or the name of a duplicate merged into it. Recipe writes resolve
+    names matching an alias, once both are normalized, to its ingredient.
+    """
+    alias = models.CharField(max_length=100, unique=True)
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='aliases')
+    
+    def __str__(self):
+        return f"{self.alias} -> {self.ingredient.name}"
+    
+    class Meta:
+        ordering = ['alias']
+        verbose_name_plural = "Ingredient aliases"
+
+
+class IngredientSubstitution(models.Model):
+    """
+    A directed edge of the substitution graph: `substitute` can stand in for
+    `ingredient` in a recipe. `weight` (0-1] rates how good the swap is;
+    chained swaps multiply their weights.
+    """
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='substitutions')
+    substitute = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='substitute_for')
+    weight = models.FloatField(default=1.0)
+    
+    def __str__(self):
+        return f"{self.ingredient.name} -> {self.substitute.name} ({self.weight:g})"
+    
+    class Meta:
+        ordering = ['ingredient__name', '-weight']
+        unique_together = ['ingredient', 'substitute']
+
+
 class Recipe(models.Model):
     DIFFICULTY_CHOICES = [
         ('easy', 'Easy'),
@@ -42,6 +77,11 @@ class Recipe(models.Model):
     difficulty = models.CharField(max_length=10, choices=DIFFICULTY_CHOICES, blank=True, null=True)
     image_url = models.URLField(blank=True, null=True)
     is_generated = models.BooleanField(default=False)
+    # Hash of (sorted ingredient ids, cuisine, generator version) for synthesized recipes
+    fingerprint = models.CharField(max_length=64, unique=True, blank=True, null=True, editable=False)
+    # Source identity of recipes imported from Spoonacular
+    spoonacular_id = models.IntegerField(unique=True, blank=True, null=True)
+    imported_at = models.DateTimeField(blank=True, null=True)
     ingredients = models.ManyToManyField(Ingredient, through='RecipeIngredient')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -63,6 +103,25 @@ class RecipeIngredient(models.Model):
         return f"{self.recipe.title} - {self.ingredient.name}"
 
 
+class SimilarRecipe(models.Model):
+    """
+    Precomputed neighbor of a recipe: `similar` shares ingredients with
+    `recipe` with Jaccard similarity `score`. Each recipe keeps its top
+    SIMILAR_RECIPES_COUNT neighbors, read by the recipe detail page.
+    """
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='similar_links')
+    similar = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    
+    def __str__(self):
+        return f"{self.recipe_id} ~ {self.similar_id} ({self.score:.2f})"
+    
+    class Meta:
+        ordering = ['recipe', '-score', 'similar']
+        unique_together = ['recipe', 'similar']
+        indexes = [models.Index(fields=['recipe', '-score'], name='recipes_similar_by_score')]
+
+
 class UserRecipeHistory(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
@@ -75,3 +134,30 @@ class UserRecipeHistory(models.Model):
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = "User Recipe Histories"
+
+
+class RecipeCatalogChange(models.Model):
+    """
+    Append-only log of recipes whose ingredients or ranking fields changed.
+    Each worker remembers the last id it applied (its catalog version) and
+    replays newer entries as deltas into its in-memory matcher state.
+    """
+    recipe_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    def __str__(self):
+        return f"Change {self.id} - recipe {self.recipe_id}"
+
+
+class QuotaBucket(models.Model):
+    """
+    Token bucket shared by every worker through the database. Tokens refill
+    continuously from `refilled_at` (epoch seconds) and are spent with a
+    single conditional UPDATE, so concurrent workers never overspend.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    tokens = models.FloatField()
+    refilled_at = models.FloatField()
+    
+    def __str__(self):
+        return f"{self.name} - {self.tokens:.2f} tokens"
@@ -0,0 +1,88 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+from django.conf import settings
+
+
+class ResultCache:
+    """
+    Thread-safe in-process LRU cache with a per-entry TTL, a size cap and
+    hit/miss counters.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any):
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def generate_cache_key(selected_ingredients: Iterable[int], cuisine: Optional[str]) -> str:
+    """Canonical hash of the sorted, de-duplicated ingredient ids plus cuisine"""
+    canonical = f"{cuisine or ''}:{','.join(str(ingredient_id) for ingredient_id in sorted(set(selected_ingredients)))}"
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+_generate_cache: Optional[ResultCache] = None
+_generate_cache_lock = threading.Lock()
+
+
+def get_generate_cache() -> ResultCache:
+    """Return the process-wide generate_recipe result cache"""
+    global _generate_cache
+    if _generate_cache is None:
+        with _generate_cache_lock:
+            if _generate_cache is None:
+                _generate_cache = ResultCache(
+                    max_size=getattr(settings, 'GENERATE_CACHE_SIZE', 1024),
+                    ttl=getattr(settings, 'GENERATE_CACHE_TTL', 600),
+                )
+    return _generate_cache
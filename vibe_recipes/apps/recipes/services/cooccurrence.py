@@ -0,0 +1,97 @@
+import math
+from itertools import combinations
+from typing import Dict, Iterable, List, NamedTuple
+
+
+class Pairing(NamedTuple):
+    """An ingredient suggested for a selection, with its association scores"""
+    ingredient_id: int
+    pmi: float
+    lift: float
+    together: int
+
+
+class CooccurrenceMatrix:
+    """
+    Sparse symmetric matrix of how many recipes use each pair of
+    ingredients, plus per-ingredient recipe counts, for pointwise mutual
+    information (PMI) and lift. Each row only holds the ingredients actually
+    seen with it; recipes are added and removed incrementally.
+    """
+
+    def __init__(self):
+        self.recipes = 0
+        self.counts: Dict[int, int] = {}
+        self.pairs: Dict[int, Dict[int, int]] = {}
+
+    def add(self, ingredient_ids: Iterable[int]):
+        self._update(ingredient_ids, 1)
+
+    def remove(self, ingredient_ids: Iterable[int]):
+        self._update(ingredient_ids, -1)
+
+    def _update(self, ingredient_ids: Iterable[int], delta: int):
+        ingredient_ids = sorted(set(ingredient_ids))
+        if not ingredient_ids:
+            return
+        self.recipes += delta
+        for ingredient_id in ingredient_ids:
+            self._bump(self.counts, ingredient_id, delta)
+        for first, second in combinations(ingredient_ids, 2):
+            self._bump(self.pairs.setdefault(first, {}), second, delta)
+            self._bump(self.pairs.setdefault(second, {}), first, delta)
+        for ingredient_id in ingredient_ids:
+            if not self.pairs.get(ingredient_id, True):
+                del self.pairs[ingredient_id]
+
+    @staticmethod
+    def _bump(counts: Dict[int, int], key: int, delta: int):
+        value = counts.get(key, 0) + delta
+        if value > 0:
+            counts[key] = value
+        else:
+            counts.pop(key, None)
+
+    def complements(self, selected: Iterable[int], limit: int = 10, min_together: int = 2) -> List[Pairing]:
+        """
+        Ingredients that pair best with the whole selection: the mean PMI
+        and lift over the selected ingredients, where a pair seen in fewer
+        than `min_together` recipes counts as no association (PMI 0, lift 1).
+        Best first, ties by how many recipes the pairs share.
+        """
+        selected = set(selected)
+        if not selected or not self.recipes or limit <= 0:
+            return []
+
+        pmi_sums: Dict[int, float] = {}
+        lift_sums: Dict[int, float] = {}
+        together: Dict[int, int] = {}
+        observed: Dict[int, int] = {}
+        for ingredient_id in selected:
+            for partner, count in self.pairs.get(ingredient_id, {}).items():
+                if partner in selected or count < min_together:
+                    continue
+                # Lift: how much more often the pair shares a recipe than chance would have it
+                lift = count * self.recipes / (self.counts[ingredient_id] * self.counts[partner])
+                pmi_sums[partner] = pmi_sums.get(partner, 0.0) + math.log(lift)
+                lift_sums[partner] = lift_sums.get(partner, 0.0) + lift
+                together[partner] = together.get(partner, 0) + count
+                observed[partner] = observed.get(partner, 0) + 1
+
+        size = len(selected)
+        ranked = sorted(
+            (
+                # Selected ingredients never seen with the partner add the neutral lift of 1
+                Pairing(partner, pmi / size, (lift_sums[partner] + size - observed[partner]) / size, together[partner])
+                for partner, pmi in pmi_sums.items()
+            ),
+            key=lambda pairing: (-pairing.pmi, -pairing.together, pairing.ingredient_id),
+        )
+        return [pairing for pairing in ranked if pairing.pmi > 0][:limit]
+
+    def stats(self):
+        return {
+            'recipes': self.recipes,
+            'ingredients': len(self.counts),
+            'pairs': sum(len(partners) for partners in self.pairs.values()) // 2,
+        }
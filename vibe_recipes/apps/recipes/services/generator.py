@@ -1,110 +1,221 @@
-from typing import List, Dict, Optional, Tuple
-from django.db.models import Q, Count
+import copy
+import hashlib
+from typing import Iterable, List, Dict, NamedTuple, Optional, Tuple
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Q, Count, F
+from django.db.models.functions import Coalesce
 from apps.recipes.models import Ingredient, Recipe, RecipeIngredient, UserRecipeHistory
 from .spoonacular import get_spoonacular_recipes, create_recipe_from_spoonacular
+from .index import get_ingredient_index
+from .cache import generate_cache_key, get_generate_cache
+from .ingredients import SelectedIngredients
+from .similarity import refresh_similar_recipes_on_commit
+from .substitutions import get_substitution_graph
+from .writer import write_recipe
+from .resilience import Deadline
 
 
-# Substitution dictionary for common ingredient replacements
-SUBSTITUTIONS = {
-    'cream': ['milk', 'butter'],
-    'milk': ['cream', 'yogurt'],
-    'butter': ['olive oil', 'vegetable oil'],
-    'beef': ['mushroom', 'tofu', 'lentils'],
-    'chicken': ['tofu', 'mushroom', 'chickpeas'],
-    'eggs': ['flax seeds', 'banana'],
-    'cheese': ['nutritional yeast', 'tofu'],
-    'garlic': ['garlic powder', 'onion'],
-    'onion': ['garlic', 'shallot'],
-    'tomato': ['bell pepper', 'carrot'],
-    'pasta': ['rice', 'quinoa'],
-    'rice': ['quinoa', 'couscous'],
-    'bread': ['tortilla', 'lettuce'],
-}
+# Bump whenever synthesize_recipe output changes, so new fingerprints stop
+# reusing recipes produced by the previous generator
+GENERATOR_VERSION = 1
+
+
+def find_substitutions(missing_ingredients: Iterable[int], available_ingredients: Iterable[int]) -> Dict[int, List[int]]:
+    """
+    Find possible substitutions for missing ingredients: maps each missing
+    ingredient id to the available ingredient ids that can replace it, best
+    first, following the substitution graph up to SUBSTITUTION_MAX_HOPS swaps.
+    """
+    return get_substitution_graph().resolve(missing_ingredients, available_ingredients)
 
 
-def get_ingredient_coverage(recipe: Recipe, selected_ingredients: List[int]) -> Tuple[float, int, int]:
+class RecipeMatch(NamedTuple):
     """
-    Calculate ingredient coverage for a recipe.
-    Returns: (coverage_ratio, matching_ingredients, missing_ingredients)
+    A ranked local match with its coverage scores. `substitutable` counts
+    the missing ingredients the selection can replace through substitutions.
     """
-    if not selected_ingredients:
-        return 0.0, 0, 0
+    recipe: Recipe
+    coverage: float
+    matching: int
+    missing: int
+    substitutable: int = 0
     
-    recipe_ingredients = set(recipe.ingredients.values_list('id', flat=True))
-    selected_set = set(selected_ingredients)
+    @property
+    def coverable(self) -> bool:
+        """Whether every missing ingredient can be substituted from the selection"""
+        return self.substitutable == self.missing
+
+
+def _rank_with_index(selected_set: set, cuisine: Optional[str], k: int) -> List[RecipeMatch]:
+    """Rank recipes with the in-memory ingredient index"""
+    index = get_ingredient_index()
+    return _index_matches(index, index.top_matches(selected_set, cuisine, k), selected_set)
+
+
+def _index_matches(index, ranked: List[Tuple[int, int, int]], selected_set: set) -> List[RecipeMatch]:
+    """Turn ranked (recipe_id, matching, missing) index rows into matches"""
+    recipes = Recipe.objects.in_bulk([recipe_id for recipe_id, _, _ in ranked])
+    graph = get_substitution_graph()
+    
+    return [
+        RecipeMatch(
+            recipes[recipe_id], matching / len(selected_set), matching, missing,
+            graph.count_coverable(set(index.ingredients_of(recipe_id) or ()) - selected_set, selected_set),
+        )
+        for recipe_id, matching, missing in ranked
+        if recipe_id in recipes
+    ]
+
+
+def _rank_with_lsh(selected_set: set, cuisine: Optional[str], k: int) -> List[RecipeMatch]:
+    """
+    Score only the recipes the MinHash LSH shortlists, falling back to the
+    exact index while the LSH is still building or when the shortlist holds
+    no match at all
+    """
+    index = get_ingredient_index(with_lsh=True)
+    ranked = index.approximate_matches(selected_set, cuisine, k) if index.lsh is not None else []
+    ranked = ranked or index.top_matches(selected_set, cuisine, k)
+    return _index_matches(index, ranked, selected_set)
+
+
+def _rank_with_database(selected_set: set, cuisine: Optional[str], k: int) -> List[RecipeMatch]:
+    """
+    Rank recipes in a single grouped query: matching and total ingredient
+    counts are aggregated per recipe over RecipeIngredient and the ordering
+    mirrors the index (coverage, missing, cooking time, newest).
+    """
+    recipes = Recipe.objects.filter(
+        id__in=RecipeIngredient.objects.filter(ingredient_id__in=selected_set).values('recipe_id')
+    )
+    if cuisine:
+        recipes = recipes.filter(cuisine=cuisine)
     
-    matching = len(recipe_ingredients.intersection(selected_set))
-    missing = len(recipe_ingredients - selected_set)
+    recipes = recipes.annotate(
+        matching=Count('recipeingredient__ingredient', filter=Q(recipeingredient__ingredient__in=selected_set), distinct=True),
+        total=Count('recipeingredient__ingredient', distinct=True),
+    ).annotate(
+        missing=F('total') - F('matching'),
+        effective_cooking_time=Coalesce('cooking_time', 0),
+    ).order_by('-matching', 'missing', 'effective_cooking_time', '-id')[:k]
+    recipes = list(recipes)
     
-    coverage = matching / len(selected_set) if selected_set else 0
+    graph = get_substitution_graph()
+    missing_by_recipe = {}
+    if graph.adjacency:
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=[recipe.id for recipe in recipes]
+        ).exclude(ingredient_id__in=selected_set).values_list('recipe_id', 'ingredient_id'):
+            missing_by_recipe.setdefault(recipe_id, set()).add(ingredient_id)
     
-    return coverage, matching, missing
+    return [
+        RecipeMatch(
+            recipe, recipe.matching / len(selected_set), recipe.matching, recipe.missing,
+            graph.count_coverable(missing_by_recipe.get(recipe.id, ()), selected_set),
+        )
+        for recipe in recipes
+    ]
+
+
+MATCHER_BACKENDS = {
+    'index': _rank_with_index,
+    'database': _rank_with_database,
+    'lsh': _rank_with_lsh,
+}
 
 
-def find_substitutions(missing_ingredients: List[str], available_ingredients: List[str]) -> Dict[str, List[str]]:
+def match_recipes(selected_ingredients: List[int], cuisine: Optional[str] = None, k: int = 5,
+                  backend: Optional[str] = None) -> List[RecipeMatch]:
     """
-    Find possible substitutions for missing ingredients.
+    Find the k best matching recipes based on ingredient coverage and cuisine,
+    best first. Only recipes sharing at least one selected ingredient are
+    scored. The backend ('index', 'database' or the approximate 'lsh')
+    defaults to the RECIPE_MATCHER_BACKEND setting.
     """
-    substitutions = {}
+    selected_set = set(selected_ingredients)
+    if not selected_set or k <= 0:
+        return []
     
-    for missing in missing_ingredients:
-        missing_lower = missing.lower()
-        if missing_lower in SUBSTITUTIONS:
-            possible_subs = []
-            for sub in SUBSTITUTIONS[missing_lower]:
-                if sub in available_ingredients:
-                    possible_subs.append(sub)
-            if possible_subs:
-                substitutions[missing] = possible_subs
+    backend = backend or getattr(settings, 'RECIPE_MATCHER_BACKEND', 'index')
+    if backend not in MATCHER_BACKENDS:
+        raise ValueError(f"Unknown recipe matcher backend: {backend}")
     
-    return substitutions
+    return MATCHER_BACKENDS[backend](selected_set, cuisine, k)
 
 
 def match_recipe(selected_ingredients: List[int], cuisine: Optional[str] = None) -> Optional[Recipe]:
     """
     Find the best matching recipe based on ingredient coverage and cuisine.
     """
-    # Get all recipes
-    recipes = Recipe.objects.all()
-    
-    # Filter by cuisine if specified
-    if cuisine:
-        recipes = recipes.filter(cuisine=cuisine)
+    matches = match_recipes(selected_ingredients, cuisine, k=1)
+    return matches[0].recipe if matches else None
+
+
+def pantry_recipes(selected_ingredients: List[int], cuisine: Optional[str] = None, limit: int = 50,
+                   backend: Optional[str] = None) -> List[RecipeMatch]:
+    """
+    "Cook with what I have": every recipe whose full ingredient list is
+    covered by the selection, up to `limit`, recipes using more of the
+    selection first. The 'database' backend answers with one grouped query,
+    the others with the in-memory ingredient index.
+    """
+    selected_set = set(selected_ingredients)
+    if not selected_set or limit <= 0:
+        return []
     
-    best_recipe = None
-    best_coverage = 0
-    best_missing = float('inf')
-    best_cooking_time = float('inf')
+    backend = backend or getattr(settings, 'RECIPE_MATCHER_BACKEND', 'index')
+    if backend not in MATCHER_BACKENDS:
+        raise ValueError(f"Unknown recipe matcher backend: {backend}")
     
-    for recipe in recipes:
-        coverage, matching, missing = get_ingredient_coverage(recipe, selected_ingredients)
-        
-        # Skip recipes with no matching ingredients
-        if matching == 0:
-            continue
-        
-        # Prefer higher coverage, fewer missing ingredients, and lower cooking time
-        if (coverage > best_coverage or 
-            (coverage == best_coverage and missing < best_missing) or
-            (coverage == best_coverage and missing == best_missing and 
-             (recipe.cooking_time or 0) < best_cooking_time)):
-            
-            best_recipe = recipe
-            best_coverage = coverage
-            best_missing = missing
-            best_cooking_time = recipe.cooking_time or 0
+    if backend == 'database':
+        recipes = Recipe.objects.filter(
+            id__in=RecipeIngredient.objects.filter(ingredient_id__in=selected_set).values('recipe_id')
+        )
+        if cuisine:
+            recipes = recipes.filter(cuisine=cuisine)
+        recipes = recipes.annotate(
+            matching=Count('recipeingredient__ingredient', filter=Q(recipeingredient__ingredient__in=selected_set), distinct=True),
+            total=Count('recipeingredient__ingredient', distinct=True),
+            effective_cooking_time=Coalesce('cooking_time', 0),
+        ).filter(matching=F('total')).order_by('-total', 'effective_cooking_time', '-id')[:limit]
+        return [RecipeMatch(recipe, recipe.total / len(selected_set), recipe.total, 0) for recipe in recipes]
     
-    return best_recipe
+    covered = get_ingredient_index().covered_by(selected_set, cuisine, limit)
+    recipes = Recipe.objects.in_bulk([recipe_id for recipe_id, _ in covered])
+    return [
+        RecipeMatch(recipes[recipe_id], total / len(selected_set), total, 0)
+        for recipe_id, total in covered
+        if recipe_id in recipes
+    ]
 
 
-def synthesize_recipe(selected_ingredients: List[int], cuisine: str) -> Recipe:
+def recipe_fingerprint(ingredient_ids: List[int], cuisine: str, version: int = GENERATOR_VERSION) -> str:
     """
-    Create a new recipe based on ONLY the selected ingredients and cuisine.
+    Content address of a synthesized recipe: the same ingredient set, cuisine
+    and generator version always produce the same recipe.
+    """
+    canonical = f"{version}:{cuisine}:{','.join(str(ingredient_id) for ingredient_id in sorted(set(ingredient_ids)))}"
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def synthesize_recipe(selected_ingredients: List[int], cuisine: str,
+                      selection: Optional[SelectedIngredients] = None) -> Recipe:
+    """
+    Create a new recipe based on ONLY the selected ingredients and cuisine,
+    or reuse the one already synthesized for the same fingerprint.
     """
     # Get ingredient names
-    ingredients = Ingredient.objects.filter(id__in=selected_ingredients)
+    if selection is None:
+        selection = SelectedIngredients.load(selected_ingredients)
+    ingredients = selection.ingredients
     ingredient_names = [ing.name.title() for ing in ingredients]
     
+    fingerprint = recipe_fingerprint([ing.id for ing in ingredients], cuisine)
+    existing = Recipe.objects.filter(fingerprint=fingerprint).first()
+    if existing:
+        return existing
+    
     # Create title based on selected ingredients
     if len(ingredient_names) == 1:
         title = f"{cuisine.title()} {ingredient_names[0]} Recipe"
@@ -129,24 +240,25 @@ def synthesize_recipe(selected_ingredients: List[int], cuisine: str) -> Recipe:
     else:
         difficulty = 'hard'
     
-    # Create the recipe
-    recipe = Recipe.objects.create(
-        title=title,
-        cuisine=cuisine,
-        description=f"A delicious {cuisine} recipe made with {', '.join(ingredient_names).lower()}.",
-        instructions=instructions,
-        cooking_time=cooking_time,
-        difficulty=difficulty,
-        is_generated=True
-    )
-    
-    # Add ingredients to recipe
-    for ingredient in ingredients:
-        RecipeIngredient.objects.create(
-            recipe=recipe,
-            ingredient=ingredient
-        )
+    try:
+        recipe = write_recipe(
+            {
+                'title': title,
+                'cuisine': cuisine,
+                'description': f"A delicious {cuisine} recipe made with {', '.join(ingredient_names).lower()}.",
+                'instructions': instructions,
+                'cooking_time': cooking_time,
+                'difficulty': difficulty,
+                'is_generated': True,
+                'fingerprint': fingerprint,
+            },
+            [{'ingredient': ingredient} for ingredient in ingredients],
+        ).recipe
+    except IntegrityError:
+        # Another request synthesized the same recipe concurrently
+        return Recipe.objects.get(fingerprint=fingerprint)
     
+    refresh_similar_recipes_on_commit(recipe.id)
     return recipe
 
 
@@ -229,9 +341,93 @@ def generate_instructions(ingredients: List[Ingredient], cuisine: str) -> str:
     return "\n\n".join(instructions)
 
 
-def generate_recipe(selected_ingredients: List[int], cuisine: str, user=None) -> Tuple[Recipe, Dict]:
+def _choose_recipe(selected_ingredients: List[int], cuisine: str, user=None,
+                   selection: Optional[SelectedIngredients] = None) -> Tuple[Recipe, Dict]:
+    """
+    Pick a recipe for the selection: Spoonacular first, then the best local
+    match, then a synthesized recipe. Returns (recipe, metadata).
+    """
+    # Every step reads the selected ingredients from this one load
+    if selection is None:
+        selection = SelectedIngredients.load(selected_ingredients)
+    
+    # First, try to get recipes from Spoonacular API within the request's time budget
+    deadline = Deadline(getattr(settings, 'GENERATE_TIME_BUDGET', 8))
+    spoonacular_recipes = get_spoonacular_recipes(selected_ingredients, cuisine, deadline, selection=selection)
+    
+    if spoonacular_recipes:
+        # Use the best Spoonacular recipe
+        best_recipe_data = spoonacular_recipes[0]
+        recipe = create_recipe_from_spoonacular(best_recipe_data, selected_ingredients, user)
+        
+        metadata = {
+            'type': 'spoonacular',
+            'source': best_recipe_data.get('source_name', 'Spoonacular'),
+            'source_url': best_recipe_data.get('source_url', ''),
+            'coverage': 1.0,
+            'missing_ingredients': [],
+            'substitutions': {},
+            'available_recipes': len(spoonacular_recipes),
+            'alternatives': []
+        }
+    else:
+        # Fallback to local recipe matching, keeping the runners-up as alternatives
+        alternatives_count = getattr(settings, 'RECIPE_MATCH_ALTERNATIVES', 3)
+        matches = match_recipes(selected_ingredients, cuisine, k=alternatives_count + 1)
+        
+        if matches:
+            # Use existing recipe
+            best_match = matches[0]
+            recipe = best_match.recipe
+            
+            # Get missing ingredients
+            recipe_ingredients = dict(recipe.ingredients.values_list('id', 'name'))
+            missing_ids = sorted(recipe_ingredients.keys() - selection.by_id.keys(), key=recipe_ingredients.get)
+            missing_ingredients = [recipe_ingredients[ingredient_id] for ingredient_id in missing_ids]
+            
+            # Find substitutions for all missing ingredients at once
+            substitutions = {
+                recipe_ingredients[ingredient_id]: [selection.by_id[substitute].name for substitute in substitutes]
+                for ingredient_id, substitutes in find_substitutions(missing_ids, selection.ids).items()
+            }
+            
+            metadata = {
+                'type': 'matched',
+                'coverage': best_match.coverage,
+                'missing_ingredients': missing_ingredients,
+                'substitutions': substitutions,
+                'coverable_with_substitutions': len(substitutions) == len(missing_ingredients),
+                'alternatives': [
+                    {
+                        'id': match.recipe.id,
+                        'title': match.recipe.title,
+                        'coverage': match.coverage,
+                        'missing': match.missing,
+                        'substitutable': match.substitutable,
+                    }
+                    for match in matches[1:]
+                ]
+            }
+        else:
+            # Create new recipe
+            recipe = synthesize_recipe(selected_ingredients, cuisine, selection=selection)
+            metadata = {
+                'type': 'generated',
+                'coverage': 1.0,
+                'missing_ingredients': [],
+                'substitutions': {},
+                'alternatives': []
+            }
+    
+    return recipe, metadata
+
+
+def generate_recipe(selected_ingredients: List[int], cuisine: str, user=None,
+                    selection: Optional[SelectedIngredients] = None) -> Tuple[Recipe, Dict]:
     """
     Main function to generate a recipe. Returns (recipe, metadata).
+    `selection` is the request's already loaded SelectedIngredients, if any;
+    it is only loaded here when the cache misses.
     """
     try:
         # Validate inputs
@@ -241,55 +437,20 @@ def generate_recipe(selected_ingredients: List[int], cuisine: str, user=None) ->
         if not cuisine:
             raise ValueError("No cuisine selected")
         
-        # First, try to get recipes from Spoonacular API
-        spoonacular_recipes = get_spoonacular_recipes(selected_ingredients, cuisine)
+        # Identical selections reuse the previously chosen recipe
+        cache = get_generate_cache()
+        cache_key = generate_cache_key(selected_ingredients, cuisine)
+        cached = cache.get(cache_key)
+        recipe = Recipe.objects.filter(id=cached['recipe_id']).first() if cached else None
         
-        if spoonacular_recipes:
-            # Use the best Spoonacular recipe
-            best_recipe_data = spoonacular_recipes[0]
-            recipe = create_recipe_from_spoonacular(best_recipe_data, selected_ingredients, user)
-            
-            metadata = {
-                'type': 'spoonacular',
-                'source': best_recipe_data.get('source_name', 'Spoonacular'),
-                'source_url': best_recipe_data.get('source_url', ''),
-                'coverage': 1.0,
-                'missing_ingredients': [],
-                'substitutions': {},
-                'available_recipes': len(spoonacular_recipes)
-            }
+        if recipe:
+            metadata = copy.deepcopy(cached['metadata'])
         else:
-            # Fallback to local recipe matching
-            matched_recipe = match_recipe(selected_ingredients, cuisine)
-            
-            if matched_recipe:
-                # Use existing recipe
-                recipe = matched_recipe
-                coverage, matching, missing = get_ingredient_coverage(recipe, selected_ingredients)
-                
-                # Get missing ingredients
-                recipe_ingredients = set(recipe.ingredients.values_list('name', flat=True))
-                selected_names = set(Ingredient.objects.filter(id__in=selected_ingredients).values_list('name', flat=True))
-                missing_ingredients = list(recipe_ingredients - selected_names)
-                
-                # Find substitutions
-                substitutions = find_substitutions(missing_ingredients, list(selected_names))
-                
-                metadata = {
-                    'type': 'matched',
-                    'coverage': coverage,
-                    'missing_ingredients': missing_ingredients,
-                    'substitutions': substitutions
-                }
-            else:
-                # Create new recipe
-                recipe = synthesize_recipe(selected_ingredients, cuisine)
-                metadata = {
-                    'type': 'generated',
-                    'coverage': 1.0,
-                    'missing_ingredients': [],
-                    'substitutions': {}
-                }
+            if cached:
+                # The cached recipe was deleted since
+                cache.discard(cache_key)
+            recipe, metadata = _choose_recipe(selected_ingredients, cuisine, user, selection)
+            cache.set(cache_key, {'recipe_id': recipe.id, 'metadata': copy.deepcopy(metadata)})
         
         # Save to user history if user is logged in
         if user and user.is_authenticated:
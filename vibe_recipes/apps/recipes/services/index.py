@@ -0,0 +1,680 @@
+import functools
+import heapq
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from apps.recipes.models import Recipe, RecipeCatalogChange, RecipeIngredient
+from .cooccurrence import CooccurrenceMatrix, Pairing
+from .minhash import MinHashLSH
+
+logger = logging.getLogger(__name__)
+
+# A column is kept as a packed bitmap once more than 1/DENSE_COLUMN_RATIO of
+# the rows use it; rarer ingredients keep a plain row list (CSR style).
+DENSE_COLUMN_RATIO = 32
+
+# Old catalog changes are pruned whenever the log grows by this many entries
+CATALOG_CHANGE_PRUNE_EVERY = 1000
+
+# At most this many skipped change ids are re-read while they may still commit
+CATALOG_MAX_GAPS = 1000
+
+# (cuisine, cooking_time, ingredient_ids) for one recipe, or None once deleted
+CatalogRow = Optional[Tuple[str, Optional[int], Iterable[int]]]
+
+
+def locked(method):
+    """Run an IngredientIndex method holding the index lock"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def iter_bits(mask: int) -> Iterator[int]:
+    """Yield the positions of the set bits of a packed row mask, lowest first"""
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+    for offset, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            yield offset * 8 + low.bit_length() - 1
+            byte ^= low
+
+
+def pack_rows(rows: Iterable[int], size: int) -> int:
+    """Pack row positions into a bitmap of `size` bits"""
+    data = bytearray((size + 7) // 8)
+    for row in rows:
+        data[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(data, 'little')
+
+
+def add_to_counter(slices: List[int], mask: int):
+    """Add 1 to every row of `mask` in a bit-sliced counter (ripple carry)"""
+    carry = mask
+    for position in range(len(slices)):
+        if not carry:
+            return
+        current = slices[position]
+        slices[position] = current ^ carry
+        carry = current & carry
+    if carry:
+        slices.append(carry)
+
+
+def bit_slices(values: List[int]) -> List[int]:
+    """Bit-slice a list of non-negative per-row values into packed masks"""
+    width = max(values, default=0).bit_length()
+    return [pack_rows((row for row, value in enumerate(values) if value >> bit & 1), len(values))
+            for bit in range(width)]
+
+
+def set_sliced_value(slices: List[int], row: int, value: int):
+    """Store `value` for one row of a bit-sliced column, widening it if needed"""
+    bit = 1 << row
+    while value.bit_length() > len(slices):
+        slices.append(0)
+    for position in range(len(slices)):
+        if value >> position & 1:
+            slices[position] |= bit
+        else:
+            slices[position] &= ~bit
+
+
+def narrow_to_max(candidates: int, slices: List[int]) -> int:
+    """Keep only the candidate rows holding the largest bit-sliced value"""
+    for mask in reversed(slices):
+        kept = candidates & mask
+        if kept:
+            candidates = kept
+    return candidates
+
+
+def narrow_to_min(candidates: int, slices: List[int]) -> int:
+    """Keep only the candidate rows holding the smallest bit-sliced value"""
+    for mask in reversed(slices):
+        kept = candidates & ~mask
+        if kept:
+            candidates = kept
+    return candidates
+
+
+def iter_buckets(candidates: int, slices: List[int], descending: bool = False) -> Iterator[Tuple[int, int]]:
+    """
+    Lazily split candidate rows into (value, mask) buckets of equal bit-sliced
+    value, in ascending (or descending) value order. Empty buckets are pruned,
+    so only the buckets a caller actually consumes are ever computed.
+    """
+    def split(mask: int, bit: int, value: int) -> Iterator[Tuple[int, int]]:
+        if not mask:
+            return
+        if bit < 0:
+            yield value, mask
+            return
+        high = mask & slices[bit]
+        low = mask & ~slices[bit]
+        branches = [(low, value), (high, value | 1 << bit)]
+        if descending:
+            branches.reverse()
+        for branch_mask, branch_value in branches:
+            yield from split(branch_mask, bit - 1, branch_value)
+
+    yield from split(candidates, len(slices) - 1, 0)
+
+
+class IngredientIndex:
+    """
+    Process-local recipe x ingredient incidence matrix.
+
+    Every recipe owns a row; every ingredient a column holding the rows that
+    use it. Matching counts for all candidate recipes are computed at once
+    by adding the selected columns into a bit-sliced counter, and ranking
+    narrows the candidate mask on counter, ingredient total and cooking time
+    slices, so no per-recipe Python loop runs on the hot path.
+
+    The index is kept current by replaying RecipeCatalogChange entries as
+    per-recipe deltas; `version` is the highest change id applied and `gaps`
+    the lower ids not seen yet, which may belong to transactions that commit
+    out of order. Queries and deltas run under `lock`, so threads always
+    read a consistent index while another one applies changes. Once
+    enable_lsh() or enable_cooccurrence() has been called, a MinHash LSH over
+    the rows (approximate candidate generation) or an ingredient
+    co-occurrence matrix ("pairs well with") is kept current alongside. The
+    LSH is slow to build, so it is built without holding `lock`.
+    """
+
+    def __init__(self):
+        self.recipe_ids: List[int] = []
+        self.row_of: Dict[int, int] = {}
+        self.row_cuisines: List[Optional[str]] = []
+        self.cooking_times: List[int] = []
+        self.row_ingredients: List[Tuple[int, ...]] = []
+        self.dense_columns: Dict[int, int] = {}
+        self.sparse_columns: Dict[int, List[int]] = {}
+        self.cuisine_masks: Dict[str, int] = {}
+        self.total_slices: List[int] = []
+        self.time_slices: List[int] = []
+        self.all_rows = 0
+        self.lsh: Optional[MinHashLSH] = None
+        # Rows changed while an LSH is being built, or None when no build runs
+        self._lsh_dirty: Optional[Set[int]] = None
+        self.cooccurrence: Optional[CooccurrenceMatrix] = None
+        self.version = 0
+        self.gaps: Dict[int, float] = {}
+        self.synced_at = time.monotonic()
+        self.lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, str, Optional[int], Iterable[int]]]) -> 'IngredientIndex':
+        """
+        Build the index from (recipe_id, cuisine, cooking_time, ingredient_ids)
+        tuples. Rows must be given in ascending recipe id order; recipes added
+        later are appended, so rows stay in arrival (newest last) order.
+        """
+        index = cls()
+        postings: Dict[int, List[int]] = {}
+        cuisine_rows: Dict[str, List[int]] = {}
+        for row, (recipe_id, cuisine, cooking_time, ingredient_ids) in enumerate(rows):
+            ingredient_ids = tuple(sorted(set(ingredient_ids)))
+            index.recipe_ids.append(recipe_id)
+            index.row_of[recipe_id] = row
+            index.row_cuisines.append(cuisine)
+            index.cooking_times.append(cooking_time or 0)
+            index.row_ingredients.append(ingredient_ids)
+            cuisine_rows.setdefault(cuisine, []).append(row)
+            for ingredient_id in ingredient_ids:
+                postings.setdefault(ingredient_id, []).append(row)
+
+        size = len(index.recipe_ids)
+        for ingredient_id, ingredient_rows in postings.items():
+            if len(ingredient_rows) * DENSE_COLUMN_RATIO > size:
+                index.dense_columns[ingredient_id] = pack_rows(ingredient_rows, size)
+            else:
+                index.sparse_columns[ingredient_id] = ingredient_rows
+        for cuisine, rows_in_cuisine in cuisine_rows.items():
+            index.cuisine_masks[cuisine] = pack_rows(rows_in_cuisine, size)
+        index.total_slices = bit_slices([len(ingredients) for ingredients in index.row_ingredients])
+        index.time_slices = bit_slices(index.cooking_times)
+        index.all_rows = (1 << size) - 1
+        return index
+
+    @classmethod
+    def build(cls) -> 'IngredientIndex':
+        """
+        Build the index from the Recipe and RecipeIngredient tables (two queries).
+        """
+        # Read the version first: changes committed while loading are replayed later
+        recent = list(RecipeCatalogChange.objects.order_by('-id').values_list('id', flat=True)[:CATALOG_MAX_GAPS])
+        rows = load_catalog_rows()
+        index = cls.from_rows(
+            (recipe_id, cuisine, cooking_time, ingredient_ids)
+            for recipe_id, (cuisine, cooking_time, ingredient_ids) in sorted(rows.items())
+        )
+        if recent:
+            index.version = recent[0]
+            index._add_gaps(recent[-1], recent, time.monotonic())
+        logger.info(f"Built ingredient index with {len(index.recipe_ids)} recipes at catalog version {index.version}")
+        return index
+
+    def sync(self) -> int:
+        """
+        Apply catalog changes recorded since the last sync as deltas, plus
+        any that committed late into a gap. The database is read without
+        holding the index lock; if another thread is already syncing this
+        index, the call returns at once. Returns the number of recipes updated.
+        """
+        if not self._sync_lock.acquire(blocking=False):
+            return 0
+        try:
+            return self._sync()
+        finally:
+            self._sync_lock.release()
+
+    def _sync(self) -> int:
+        now = time.monotonic()
+        # Ids still missing after the timeout belong to rolled back transactions
+        gap_timeout = getattr(settings, 'RECIPE_CATALOG_GAP_TIMEOUT', 300)
+        self.gaps = {change_id: seen for change_id, seen in self.gaps.items() if now - seen < gap_timeout}
+        newer = Q(id__gt=self.version)
+        if self.gaps:
+            newer |= Q(id__in=list(self.gaps))
+        changes = list(RecipeCatalogChange.objects.filter(newer).order_by('id').values_list('id', 'recipe_id'))
+        self.synced_at = now
+        if not changes:
+            return 0
+
+        recipe_ids = {recipe_id for _, recipe_id in changes}
+        rows = load_catalog_rows(recipe_ids)
+        previous_version = self.version
+        with self.lock:
+            self.apply_changes({recipe_id: rows.get(recipe_id) for recipe_id in recipe_ids})
+            self.version = max(previous_version, changes[-1][0])
+
+        change_ids = [change_id for change_id, _ in changes]
+        for change_id in change_ids:
+            self.gaps.pop(change_id, None)
+        self._add_gaps(previous_version, change_ids, now)
+        if self.version // CATALOG_CHANGE_PRUNE_EVERY != previous_version // CATALOG_CHANGE_PRUNE_EVERY:
+            prune_catalog_changes()
+        return len(recipe_ids)
+
+    def _add_gaps(self, after: int, change_ids: Iterable[int], now: float):
+        """Remember the ids between `after` and the version that were not seen"""
+        seen = set(change_ids)
+        for change_id in range(max(after, self.version - CATALOG_MAX_GAPS) + 1, self.version):
+            if change_id not in seen:
+                self.gaps.setdefault(change_id, now)
+        if len(self.gaps) > CATALOG_MAX_GAPS:
+            self.gaps = dict(sorted(self.gaps.items())[-CATALOG_MAX_GAPS:])
+
+    @locked
+    def apply_changes(self, changes: Dict[int, CatalogRow]):
+        """Replace (or drop, for None) the rows of the given recipes"""
+        for recipe_id, data in changes.items():
+            row = self.row_of.get(recipe_id)
+            if row is not None:
+                self._clear_row(row)
+            if data is None:
+                if row is not None:
+                    del self.row_of[recipe_id]
+                continue
+            if row is None:
+                row = self._append_row(recipe_id)
+            self._fill_row(row, *data)
+
+    def enable_lsh(self, bands: int, rows: int) -> Optional[MinHashLSH]:
+        """
+        Build the MinHash LSH over the current rows, unless one with these
+        parameters exists. The build reads a snapshot of the rows without
+        holding the index lock; rows changed meanwhile are re-added before the
+        LSH is swapped in. Returns None if another thread is already building.
+        """
+        with self.lock:
+            if self.lsh is not None and (self.lsh.bands, self.lsh.rows) == (bands, rows):
+                return self.lsh
+            if self._lsh_dirty is not None:
+                return None
+            self._lsh_dirty = set()
+            snapshot = list(self.row_ingredients)
+
+        try:
+            lsh = MinHashLSH(bands, rows)
+            for row, ingredient_ids in enumerate(snapshot):
+                lsh.add(row, ingredient_ids)
+            with self.lock:
+                for row in self._lsh_dirty:
+                    lsh.remove(row)
+                    lsh.add(row, self.row_ingredients[row])
+                self.lsh = lsh
+            logger.info(f"Built MinHash LSH ({bands}x{rows}) over {len(snapshot)} recipes")
+            return lsh
+        finally:
+            with self.lock:
+                self._lsh_dirty = None
+
+    def enable_lsh_in_background(self, bands: int, rows: int):
+        """Start building the MinHash LSH on a daemon thread, unless it exists or is being built"""
+        with self.lock:
+            if self._lsh_dirty is not None or (
+                self.lsh is not None and (self.lsh.bands, self.lsh.rows) == (bands, rows)
+            ):
+                return
+        threading.Thread(target=self.enable_lsh, args=(bands, rows), name='ingredient-index-lsh', daemon=True).start()
+
+    @locked
+    def enable_cooccurrence(self) -> CooccurrenceMatrix:
+        """Count ingredient pairs over the current rows, unless already counted"""
+        if self.cooccurrence is None:
+            matrix = CooccurrenceMatrix()
+            for ingredient_ids in self.row_ingredients:
+                matrix.add(ingredient_ids)
+            self.cooccurrence = matrix
+        return self.cooccurrence
+
+    @locked
+    def ingredients_of(self, recipe_id: int) -> Optional[Tuple[int, ...]]:
+        """The ingredient ids of an indexed recipe, or None if it is not indexed"""
+        row = self.row_of.get(recipe_id)
+        return None if row is None else self.row_ingredients[row]
+
+    @locked
+    def complements(self, selected_ingredients: Iterable[int], limit: int = 10, min_together: int = 2) -> List[Pairing]:
+        """Ingredients that pair well with a selection. Requires enable_cooccurrence()"""
+        if self.cooccurrence is None:
+            raise RuntimeError("enable_cooccurrence() must be called before looking up pairings")
+        return self.cooccurrence.complements(selected_ingredients, limit, min_together)
+
+    def _append_row(self, recipe_id: int) -> int:
+        row = len(self.recipe_ids)
+        self.recipe_ids.append(recipe_id)
+        self.row_of[recipe_id] = row
+        self.row_cuisines.append(None)
+        self.cooking_times.append(0)
+        self.row_ingredients.append(())
+        return row
+
+    def _clear_row(self, row: int):
+        bit = 1 << row
+        for ingredient_id in self.row_ingredients[row]:
+            if ingredient_id in self.dense_columns:
+                self.dense_columns[ingredient_id] &= ~bit
+            else:
+                rows = self.sparse_columns[ingredient_id]
+                rows.remove(row)
+                if not rows:
+                    del self.sparse_columns[ingredient_id]
+        cuisine = self.row_cuisines[row]
+        if cuisine is not None:
+            self.cuisine_masks[cuisine] &= ~bit
+        set_sliced_value(self.total_slices, row, 0)
+        set_sliced_value(self.time_slices, row, 0)
+        self.all_rows &= ~bit
+        if self.lsh is not None:
+            self.lsh.remove(row)
+        if self._lsh_dirty is not None:
+            self._lsh_dirty.add(row)
+        if self.cooccurrence is not None:
+            self.cooccurrence.remove(self.row_ingredients[row])
+        self.row_cuisines[row] = None
+        self.cooking_times[row] = 0
+        self.row_ingredients[row] = ()
+
+    def _fill_row(self, row: int, cuisine: str, cooking_time: Optional[int], ingredient_ids: Iterable[int]):
+        bit = 1 << row
+        ingredient_ids = tuple(sorted(set(ingredient_ids)))
+        for ingredient_id in ingredient_ids:
+            if ingredient_id in self.dense_columns:
+                self.dense_columns[ingredient_id] |= bit
+                continue
+            rows = self.sparse_columns.setdefault(ingredient_id, [])
+            rows.append(row)
+            if len(rows) * DENSE_COLUMN_RATIO > len(self.recipe_ids):
+                self.dense_columns[ingredient_id] = pack_rows(self.sparse_columns.pop(ingredient_id), len(self.recipe_ids))
+        self.cuisine_masks[cuisine] = self.cuisine_masks.get(cuisine, 0) | bit
+        set_sliced_value(self.total_slices, row, len(ingredient_ids))
+        set_sliced_value(self.time_slices, row, cooking_time or 0)
+        self.all_rows |= bit
+        if self.lsh is not None:
+            self.lsh.add(row, ingredient_ids)
+        if self._lsh_dirty is not None:
+            self._lsh_dirty.add(row)
+        if self.cooccurrence is not None:
+            self.cooccurrence.add(ingredient_ids)
+        self.row_cuisines[row] = cuisine
+        self.cooking_times[row] = cooking_time or 0
+        self.row_ingredients[row] = ingredient_ids
+
+    def column(self, ingredient_id: int) -> int:
+        """Return the packed row mask of recipes using an ingredient"""
+        dense = self.dense_columns.get(ingredient_id)
+        if dense is not None:
+            return dense
+        rows = self.sparse_columns.get(ingredient_id)
+        if not rows:
+            return 0
+        return pack_rows(rows, len(self.recipe_ids))
+
+    def candidate_mask(self, cuisine: Optional[str] = None) -> int:
+        """Rows eligible for a query, optionally restricted to one cuisine"""
+        if cuisine:
+            return self.cuisine_masks.get(cuisine, 0)
+        return self.all_rows
+
+    def count_matching(self, selected_ingredients: Iterable[int], candidates: int) -> Tuple[List[int], int]:
+        """
+        Vectorized pass over the selected columns. Returns the bit-sliced
+        matching counter and the mask of candidate rows matching at least once.
+        """
+        counter: List[int] = []
+        matched = 0
+        for ingredient_id in set(selected_ingredients):
+            mask = self.column(ingredient_id) & candidates
+            if mask:
+                add_to_counter(counter, mask)
+                matched |= mask
+        return counter, matched
+
+    @locked
+    def best_match(self, selected_ingredients: List[int], cuisine: Optional[str] = None) -> Optional[int]:
+        """
+        Return the id of the best matching recipe: higher coverage, then fewer
+        missing ingredients, then lower cooking time, then the newest recipe.
+        """
+        counter, candidates = self.count_matching(selected_ingredients, self.candidate_mask(cuisine))
+        if not candidates:
+            return None
+        # Coverage is matching / len(selected), so the top rows share one
+        # matching count and fewer missing means a smaller ingredient total
+        candidates = narrow_to_max(candidates, counter)
+        candidates = narrow_to_min(candidates, self.total_slices)
+        candidates = narrow_to_min(candidates, self.time_slices)
+        # Rows are kept in ascending recipe id order, so the highest row is the newest
+        return self.recipe_ids[candidates.bit_length() - 1]
+
+    @locked
+    def top_matches(self, selected_ingredients: List[int], cuisine: Optional[str] = None,
+                    k: int = 5) -> List[Tuple[int, int, int]]:
+        """
+        Return up to k (recipe_id, matching, missing) tuples in the same order
+        as best_match. Rows are walked bucket by bucket (matching count, then
+        ingredient total) and only the bucket that crosses k is materialized
+        into a bounded heap, so the catalog is never sorted.
+        """
+        counter, candidates = self.count_matching(selected_ingredients, self.candidate_mask(cuisine))
+        results: List[Tuple[int, int, int]] = []
+        if k <= 0:
+            return results
+
+        for matching, level in iter_buckets(candidates, counter, descending=True):
+            for total, bucket in iter_buckets(level, self.total_slices):
+                need = k - len(results)
+                if need == 1:
+                    rows = [narrow_to_min(bucket, self.time_slices).bit_length() - 1]
+                else:
+                    rows = heapq.nsmallest(need, iter_bits(bucket), key=lambda row: (self.cooking_times[row], -row))
+                results.extend((self.recipe_ids[row], matching, total - matching) for row in rows)
+                if len(results) >= k:
+                    return results
+        return results
+
+    @locked
+    def covered_by(self, selected_ingredients: Iterable[int], cuisine: Optional[str] = None,
+                   limit: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        Pantry query: return (recipe_id, ingredient_count) for every recipe
+        whose whole ingredient list is within the selection, recipes using
+        more of it first, then by cooking time and newest. A row is covered
+        when its matching counter equals its ingredient total, which is
+        compared slice by slice for all candidate rows at once.
+        """
+        counter, candidates = self.count_matching(selected_ingredients, self.candidate_mask(cuisine))
+        differs = 0
+        for position in range(max(len(counter), len(self.total_slices))):
+            matching = counter[position] if position < len(counter) else 0
+            total = self.total_slices[position] if position < len(self.total_slices) else 0
+            differs |= matching ^ total
+        covered = candidates & ~differs
+
+        results: List[Tuple[int, int]] = []
+        for total, bucket in iter_buckets(covered, self.total_slices, descending=True):
+            rows = sorted(iter_bits(bucket), key=lambda row: (self.cooking_times[row], -row))
+            results.extend((self.recipe_ids[row], total) for row in rows)
+            if limit is not None and len(results) >= limit:
+                return results[:limit]
+        return results
+
+    @locked
+    def similar_to(self, ingredient_ids: Iterable[int], n: int = 6, exclude_recipe: Optional[int] = None,
+                   min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """
+        Return the n (recipe_id, jaccard) pairs most similar to an ingredient
+        set, best first and newest on ties. Rows are walked by shared count
+        (descending) then ingredient total (ascending), which orders scores
+        within a level, and the walk stops once no remaining level can beat
+        the current n-th score.
+        """
+        ingredient_ids = set(ingredient_ids)
+        size = len(ingredient_ids)
+        if not size or n <= 0:
+            return []
+        candidates = self.all_rows
+        if exclude_recipe in self.row_of:
+            candidates &= ~(1 << self.row_of[exclude_recipe])
+        counter, candidates = self.count_matching(ingredient_ids, candidates)
+
+        best: List[Tuple[float, int]] = []
+        for shared, level in iter_buckets(candidates, counter, descending=True):
+            # A recipe made of exactly the shared ingredients scores shared / size
+            ceiling = shared / size
+            if ceiling < min_score or (len(best) >= n and ceiling < best[0][0]):
+                break
+            for total, bucket in iter_buckets(level, self.total_slices):
+                score = shared / (size + total - shared)
+                if score < min_score or (len(best) >= n and score < best[0][0]):
+                    break
+                for row in iter_bits(bucket):
+                    item = (score, self.recipe_ids[row])
+                    if len(best) < n:
+                        heapq.heappush(best, item)
+                    elif item > best[0]:
+                        heapq.heapreplace(best, item)
+        return [(recipe_id, score) for score, recipe_id in sorted(best, reverse=True)]
+
+    @locked
+    def approximate_matches(self, selected_ingredients: Iterable[int], cuisine: Optional[str] = None,
+                            k: int = 5) -> List[Tuple[int, int, int]]:
+        """
+        Like top_matches, but only the rows the MinHash LSH shortlists are
+        scored (exactly) and ranked. Requires enable_lsh(); recall depends
+        on its bands and rows.
+        """
+        if self.lsh is None:
+            raise RuntimeError("enable_lsh() must be called before approximate matching")
+        selected_set = set(selected_ingredients)
+        if k <= 0:
+            return []
+
+        # The shortlist is small, so it is scored row by row rather than through full-width columns
+        scored = []
+        for row in self.lsh.candidates(selected_set):
+            if cuisine and self.row_cuisines[row] != cuisine:
+                continue
+            ingredient_ids = self.row_ingredients[row]
+            matching = len(selected_set.intersection(ingredient_ids))
+            if matching:
+                scored.append((-matching, len(ingredient_ids) - matching, self.cooking_times[row], -row))
+        return [
+            (self.recipe_ids[-negative_row], -negative_matching, missing)
+            for negative_matching, missing, _, negative_row in heapq.nsmallest(k, scored)
+        ]
+
+
+def load_catalog_rows(recipe_ids: Optional[Iterable[int]] = None) -> Dict[int, CatalogRow]:
+    """
+    Load (cuisine, cooking_time, ingredient_ids) for the given recipes, or the
+    whole catalog, in two queries. Deleted recipes are simply absent.
+    """
+    recipes = Recipe.objects.all()
+    recipe_ingredients = RecipeIngredient.objects.all()
+    if recipe_ids is not None:
+        recipe_ids = list(recipe_ids)
+        recipes = recipes.filter(id__in=recipe_ids)
+        recipe_ingredients = recipe_ingredients.filter(recipe_id__in=recipe_ids)
+
+    ingredients_by_recipe: Dict[int, Set[int]] = {}
+    for recipe_id, ingredient_id in recipe_ingredients.values_list('recipe_id', 'ingredient_id'):
+        ingredients_by_recipe.setdefault(recipe_id, set()).add(ingredient_id)
+
+    return {
+        recipe_id: (cuisine, cooking_time, ingredients_by_recipe.get(recipe_id, set()))
+        for recipe_id, cuisine, cooking_time in recipes.values_list('id', 'cuisine', 'cooking_time')
+    }
+
+
+_pending_changes = threading.local()
+
+
+def record_catalog_change(recipe_ids: Iterable[int]):
+    """
+    Log recipes whose matcher-relevant data changed. Call this after writes
+    that bypass model signals, such as bulk_create or queryset updates.
+    Inside batch_catalog_changes() the ids are collected and logged once.
+    """
+    recipe_ids = {recipe_id for recipe_id in recipe_ids if recipe_id is not None}
+    pending = getattr(_pending_changes, 'recipe_ids', None)
+    if pending is not None:
+        pending.update(recipe_ids)
+        return
+    RecipeCatalogChange.objects.bulk_create([RecipeCatalogChange(recipe_id=recipe_id) for recipe_id in recipe_ids])
+
+
+@contextmanager
+def batch_catalog_changes():
+    """
+    Collapse the per-row change entries written by signals during a bulk
+    write into one entry per recipe, logged when the block exits.
+    """
+    if getattr(_pending_changes, 'recipe_ids', None) is not None:
+        # Nested batch: the outermost block logs everything
+        yield
+        return
+    _pending_changes.recipe_ids = set()
+    try:
+        yield
+        recipe_ids = _pending_changes.recipe_ids
+    finally:
+        _pending_changes.recipe_ids = None
+    record_catalog_change(recipe_ids)
+
+
+def prune_catalog_changes():
+    """Delete catalog changes older than RECIPE_CATALOG_CHANGE_RETENTION seconds"""
+    retention = getattr(settings, 'RECIPE_CATALOG_CHANGE_RETENTION', 86400)
+    cutoff = timezone.now() - timedelta(seconds=retention)
+    RecipeCatalogChange.objects.filter(created_at__lt=cutoff).delete()
+
+
+_index: Optional[IngredientIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_ingredient_index(with_lsh: bool = False, with_cooccurrence: bool = False) -> IngredientIndex:
+    """
+    Return the process-wide ingredient index, building it on first use and
+    applying newer catalog changes before returning it. A worker idle for
+    longer than the change retention rebuilds, since its deltas may be pruned.
+    Only building holds the module lock; syncing is guarded by the index's
+    own locks. With `with_lsh`, a MinHash LSH with the RECIPE_LSH_BANDS and
+    RECIPE_LSH_ROWS settings starts building in the background (check
+    `index.lsh` before approximate matching), and with `with_cooccurrence`
+    the index carries an ingredient co-occurrence matrix.
+    """
+    global _index
+    retention = getattr(settings, 'RECIPE_CATALOG_CHANGE_RETENTION', 86400)
+    index = _index
+    if index is None or time.monotonic() - index.synced_at > retention:
+        with _index_lock:
+            if _index is None or time.monotonic() - _index.synced_at > retention:
+                _index = IngredientIndex.build()
+            index = _index
+    if with_lsh:
+        index.enable_lsh_in_background(getattr(settings, 'RECIPE_LSH_BANDS', 32), getattr(settings, 'RECIPE_LSH_ROWS', 2))
+    if with_cooccurrence:
+        index.enable_cooccurrence()
+    index.sync()
+    return index
+
+
+def reset_ingredient_index():
+    """Drop the process-wide index so the next lookup rebuilds it"""
+    global _index
+    with _index_lock:
+        _index = None
@@ -0,0 +1,226 @@
+import logging
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set
+from django.conf import settings
+from django.db.models.functions import Lower
+from apps.recipes.models import Ingredient, IngredientAlias
+
+logger = logging.getLogger(__name__)
+
+# Preparation and quality words that do not change which ingredient is meant
+DESCRIPTORS = {
+    'fresh', 'freshly', 'ripe', 'large', 'medium', 'small', 'whole', 'raw', 'organic',
+    'chopped', 'diced', 'minced', 'sliced', 'grated', 'shredded', 'peeled', 'crushed',
+    'finely', 'roughly', 'thinly', 'boneless', 'skinless', 'extra', 'virgin', 'optional',
+}
+# Words ending in s that are not plurals
+INVARIANT_WORDS = {'asparagus', 'couscous', 'hummus', 'molasses', 'swiss', 'brussels', 'citrus', 'harissa'}
+IRREGULAR_PLURALS = {'leaves': 'leaf', 'halves': 'half', 'loaves': 'loaf'}
+# Singulars ending in ie, whose plurals would otherwise lose it ("cookies" -> "cooky")
+IE_SINGULARS = {'brownie', 'cookie', 'pie', 'veggie', 'smoothie', 'hoagie', 'pierogie', 'calorie', 'beanie'}
+
+# Words of Unicode letters (with inner apostrophes or hyphens), or percentage
+# qualifiers such as "2%"; bare quantities like "2" or "1.5" are dropped
+NAME_WORD = re.compile(r"\d+(?:\.\d+)?%|[^\W\d_](?:[^\W\d_]|['-](?=[^\W\d_]))*")
+
+
+def singularize(word: str) -> str:
+    """Undo the common English plural endings of a single word"""
+    if word in INVARIANT_WORDS or len(word) <= 3:
+        return word
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if word.endswith('ies'):
+        return word[:-1] if word[:-1] in IE_SINGULARS else word[:-3] + 'y'
+    if word.endswith('oes') or word.endswith(('ches', 'shes', 'sses', 'xes')):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def fold_accents(text: str) -> str:
+    """Strip combining accents ("jalapeño" -> "jalapeno")"""
+    return ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+
+
+def clean_ingredient_name(name: str) -> str:
+    """
+    Display name for a raw ingredient name: its own casing and accents, but
+    without parentheticals, trailing clauses, quantities, punctuation or
+    descriptors ("2 Ripe Jalapeños (seeded), diced" -> "Jalapeños").
+    """
+    name = re.sub(r'\([^)]*\)', ' ', name).split(',')[0]
+    return ' '.join(word for word in NAME_WORD.findall(name) if word.lower() not in DESCRIPTORS)[:100]
+
+
+def normalize_ingredient_name(name: str) -> str:
+    """
+    Canonical key for an ingredient name: the cleaned name lowercased,
+    without accents and with the last word singularized ("2 Ripe Tomatoes,
+    diced" -> "tomato", "2% Milk" -> "2% milk"). Only used for lookups and
+    aliases, never shown. Returns '' when nothing is left.
+    """
+    words = fold_accents(clean_ingredient_name(name).lower()).split()
+    if not words:
+        return ''
+    words[-1] = singularize(words[-1])
+    return ' '.join(words)[:100]
+
+
+class SelectedIngredients:
+    """
+    Identity map of the ingredients selected for one generate request,
+    loaded with a single query and passed down the pipeline so each step
+    reads names and categories without querying them again.
+    """
+
+    def __init__(self, ingredient_ids: Iterable[int], ingredients: List[Ingredient]):
+        self.requested_ids = list(dict.fromkeys(ingredient_ids))
+        # Ingredient.Meta ordering (by name) is kept for titles and instructions
+        self.ingredients = ingredients
+        self.by_id = {ingredient.id: ingredient for ingredient in ingredients}
+
+    @classmethod
+    def load(cls, ingredient_ids: Iterable[int]) -> 'SelectedIngredients':
+        ingredient_ids = list(ingredient_ids)
+        return cls(ingredient_ids, list(Ingredient.objects.filter(id__in=set(ingredient_ids))))
+
+    @property
+    def ids(self) -> List[int]:
+        """Requested ids that exist, in request order"""
+        return [ingredient_id for ingredient_id in self.requested_ids if ingredient_id in self.by_id]
+
+    @property
+    def unknown_ids(self) -> List[int]:
+        return [ingredient_id for ingredient_id in self.requested_ids if ingredient_id not in self.by_id]
+
+    @property
+    def names(self) -> List[str]:
+        return [ingredient.name for ingredient in self.ingredients]
+
+    @property
+    def name_set(self) -> Set[str]:
+        return set(self.names)
+
+
+class IngredientResolver:
+    """
+    In-process map of normalized ingredient names and aliases to canonical
+    ingredient ids, resolving whole batches of raw names in a few queries.
+    The map is reloaded every `ttl` seconds to pick up other workers' writes.
+    """
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._ids: Dict[str, int] = {}
+        self._loaded_at: Optional[float] = None
+
+    def _load(self):
+        ids = {}
+        for ingredient_id, name in Ingredient.objects.order_by('-id').values_list('id', 'name'):
+            # The oldest ingredient wins when several names normalize alike
+            ids[normalize_ingredient_name(name)] = ingredient_id
+        for alias, ingredient_id in IngredientAlias.objects.values_list('alias', 'ingredient_id'):
+            # Aliases typed into the admin may not be normalized yet
+            ids[normalize_ingredient_name(alias)] = ingredient_id
+        ids.pop('', None)
+        with self._lock:
+            self._ids = ids
+            self._loaded_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._ids = {}
+            self._loaded_at = None
+
+    def resolve(self, names: Iterable[str], category: str = 'other') -> Dict[str, int]:
+        """
+        Map raw ingredient names to canonical ingredient ids, creating the
+        ingredients no name or alias resolves to under their cleaned name,
+        with their normalized key as an alias. Names that normalize to
+        nothing are left out.
+        """
+        with self._lock:
+            expired = self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl
+        if expired:
+            self._load()
+
+        keys = {name: normalize_ingredient_name(name) for name in set(names) if name}
+        keys = {name: key for name, key in keys.items() if key}
+        with self._lock:
+            known = {key: self._ids[key] for key in set(keys.values()) if key in self._ids}
+
+        # Drop ids of ingredients deleted (e.g. merged) since the map was loaded
+        live = set(Ingredient.objects.filter(id__in=set(known.values())).values_list('id', flat=True))
+        known = {key: ingredient_id for key, ingredient_id in known.items() if ingredient_id in live}
+
+        missing = set(keys.values()) - known.keys()
+        if missing:
+            # Sorted, so the same batch always picks the same display name for a key
+            display_names = {}
+            for name in sorted(keys):
+                if keys[name] in missing:
+                    display_names.setdefault(keys[name], clean_ingredient_name(name))
+            known.update(self._lookup_or_create(display_names, category))
+            with self._lock:
+                self._ids.update(known)
+        return {name: known[key] for name, key in keys.items() if key in known}
+
+    def _lookup_or_create(self, display_names: Dict[str, str], category: str) -> Dict[str, int]:
+        """
+        Find keys written by other workers since the last load, creating the
+        rest from `display_names` (key -> cleaned name) and aliasing each new
+        ingredient under its key.
+        """
+        found = dict(IngredientAlias.objects.filter(alias__in=display_names).values_list('alias', 'ingredient_id'))
+        found.update(self._find_by_name(display_names[key] for key in display_names.keys() - found.keys()))
+        found = {key: ingredient_id for key, ingredient_id in found.items() if key in display_names}
+
+        new_keys = display_names.keys() - found.keys()
+        if new_keys:
+            batch_size = getattr(settings, 'RECIPE_WRITE_BATCH_SIZE', 500)
+            # ignore_conflicts tolerates concurrent inserts but leaves pks unset, so re-read them
+            Ingredient.objects.bulk_create(
+                [Ingredient(name=display_names[key], category=category) for key in new_keys],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+            created = self._find_by_name(display_names[key] for key in new_keys)
+            found.update(created)
+            IngredientAlias.objects.bulk_create(
+                [IngredientAlias(alias=key, ingredient_id=ingredient_id) for key, ingredient_id in created.items()
+                 if key != display_names[key].lower()],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+            logger.info(f"Created {len(new_keys)} new ingredients: {sorted(display_names[key] for key in new_keys)}")
+        return found
+
+    @staticmethod
+    def _find_by_name(names: Iterable[str]) -> Dict[str, int]:
+        """Keys of the ingredients named like `names`, ignoring case; the oldest wins"""
+        found = {}
+        for ingredient_id, name in Ingredient.objects.annotate(lower_name=Lower('name')).filter(
+            lower_name__in={name.lower() for name in names}
+        ).order_by('-id').values_list('id', 'name'):
+            found[normalize_ingredient_name(name)] = ingredient_id
+        return found
+
+
+_resolver: Optional[IngredientResolver] = None
+_resolver_lock = threading.Lock()
+
+
+def get_ingredient_resolver() -> IngredientResolver:
+    """Return the process-wide ingredient resolver"""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = IngredientResolver(ttl=getattr(settings, 'INGREDIENT_RESOLVER_TTL', 300))
+    return _resolver
@@ -0,0 +1,83 @@
+import random
+from typing import Dict, Iterable, List, Set, Tuple
+
+# Mersenne prime modulus of the universal hash family (a * x + b) mod p
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+class MinHashLSH:
+    """
+    Locality-sensitive index of recipe ingredient sets for approximate
+    candidate generation.
+
+    Each set gets a MinHash signature of `bands * rows` values, cut into
+    `bands` bands of `rows` values; rows sharing any band with the query are
+    candidates. A pair with Jaccard similarity J becomes a candidate with
+    probability 1 - (1 - J^rows)^bands, so more bands raise recall and more
+    rows per band shrink the shortlist: together they are the recall/latency
+    knob.
+    """
+
+    def __init__(self, bands: int = 32, rows: int = 2, seed: int = 1):
+        if bands < 1 or rows < 1:
+            raise ValueError("MinHash LSH needs at least one band of one row")
+        self.bands = bands
+        self.rows = rows
+        rng = random.Random(seed)
+        self.hash_params = [
+            (rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+            for _ in range(bands * rows)
+        ]
+        self.buckets: List[Dict[Tuple[int, ...], Set[int]]] = [{} for _ in range(bands)]
+        self.row_keys: Dict[int, List[Tuple[int, ...]]] = {}
+        self._hashes: Dict[int, Tuple[int, ...]] = {}
+
+    def _ingredient_hashes(self, ingredient_id: int) -> Tuple[int, ...]:
+        """The ingredient's value under every hash function, memoized per id"""
+        hashes = self._hashes.get(ingredient_id)
+        if hashes is None:
+            hashes = tuple((a * ingredient_id + b) % MERSENNE_PRIME for a, b in self.hash_params)
+            self._hashes[ingredient_id] = hashes
+        return hashes
+
+    def signature(self, ingredient_ids: Iterable[int]) -> List[int]:
+        """Element-wise minimum of the ingredients' hash vectors"""
+        vectors = [self._ingredient_hashes(ingredient_id) for ingredient_id in set(ingredient_ids)]
+        if not vectors:
+            return []
+        if len(vectors) == 1:
+            return list(vectors[0])
+        return list(map(min, *vectors))
+
+    def band_keys(self, ingredient_ids: Iterable[int]) -> List[Tuple[int, ...]]:
+        signature = self.signature(ingredient_ids)
+        if not signature:
+            return []
+        return [tuple(signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def add(self, row: int, ingredient_ids: Iterable[int]):
+        keys = self.band_keys(ingredient_ids)
+        if not keys:
+            return
+        self.row_keys[row] = keys
+        for buckets, key in zip(self.buckets, keys):
+            buckets.setdefault(key, set()).add(row)
+
+    def remove(self, row: int):
+        keys = self.row_keys.pop(row, None)
+        if not keys:
+            return
+        for buckets, key in zip(self.buckets, keys):
+            rows = buckets[key]
+            rows.discard(row)
+            if not rows:
+                del buckets[key]
+
+    def candidates(self, ingredient_ids: Iterable[int]) -> Set[int]:
+        """Rows sharing at least one band with the given ingredient set"""
+        rows: Set[int] = set()
+        for buckets, key in zip(self.buckets, self.band_keys(ingredient_ids)):
+            bucket = buckets.get(key)
+            if bucket:
+                rows |= bucket
+        return rows
@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Least
+from django.db.models.lookups import GreaterThanOrEqual
+from apps.recipes.models import QuotaBucket
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Cross-process token bucket over a QuotaBucket row holding up to
+    `capacity` tokens that refill evenly over `period` seconds.
+    """
+
+    def __init__(self, name: str, capacity: float, period: float = 24 * 3600):
+        self.name = name
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self._created = False
+        self._lock = threading.Lock()
+        self.granted = 0
+        self.denied = 0
+
+    def _ensure_row(self):
+        if not self._created:
+            QuotaBucket.objects.get_or_create(
+                name=self.name, defaults={'tokens': self.capacity, 'refilled_at': time.time()},
+            )
+            self._created = True
+
+    def _refilled(self, now: float):
+        """SQL expression for the tokens available at `now`"""
+        return Least(
+            F('tokens') + (Value(now) - F('refilled_at')) * Value(self.rate),
+            Value(self.capacity),
+        )
+
+    def acquire(self, cost: float) -> bool:
+        """Spend `cost` tokens if that many are available; never blocks"""
+        self._ensure_row()
+        now = time.time()
+        refilled = self._refilled(now)
+        # Refill and spend in one statement, so the check and the spend cannot interleave
+        acquired = QuotaBucket.objects.filter(GreaterThanOrEqual(refilled, cost), name=self.name).update(
+            tokens=refilled - cost, refilled_at=now,
+        ) == 1
+        with self._lock:
+            if acquired:
+                self.granted += 1
+            else:
+                self.denied += 1
+        return acquired
+
+    def charge(self, cost: float):
+        """
+        Spend `cost` tokens unconditionally, e.g. to settle the actual cost of
+        a call; a negative cost refunds tokens, up to the capacity
+        """
+        self._ensure_row()
+        now = time.time()
+        refilled = self._refilled(now)
+        QuotaBucket.objects.filter(name=self.name).update(
+            tokens=Least(refilled - Value(cost), Value(self.capacity)), refilled_at=now,
+        )
+
+    def drain(self):
+        """Empty the bucket, e.g. when the upstream reports the quota as spent"""
+        self._ensure_row()
+        QuotaBucket.objects.filter(name=self.name).update(tokens=0, refilled_at=time.time())
+
+    def remaining(self) -> float:
+        self._ensure_row()
+        bucket = QuotaBucket.objects.values('tokens', 'refilled_at').get(name=self.name)
+        return min(self.capacity, bucket['tokens'] + (time.time() - bucket['refilled_at']) * self.rate)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            granted, denied = self.granted, self.denied
+        return {
+            'remaining': round(self.remaining(), 2),
+            'capacity': self.capacity,
+            'granted': granted,
+            'denied': denied,
+        }
+
+
+_spoonacular_quota: Optional[TokenBucket] = None
+_spoonacular_quota_lock = threading.Lock()
+
+
+def get_spoonacular_quota() -> TokenBucket:
+    """Return the bucket tracking the daily Spoonacular API points"""
+    global _spoonacular_quota
+    if _spoonacular_quota is None:
+        with _spoonacular_quota_lock:
+            if _spoonacular_quota is None:
+                _spoonacular_quota = TokenBucket(
+                    'spoonacular', getattr(settings, 'SPOONACULAR_DAILY_POINTS', 150),
+                )
+    return _spoonacular_quota
@@ -0,0 +1,168 @@
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class Deadline:
+    """Absolute time budget for a request, shared by every call made on its behalf"""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: float) -> float:
+        """Timeout for one call: the remaining budget, but never more than `cap`"""
+        return min(cap, self.remaining())
+
+
+def remaining_timeout(deadline: Optional[Deadline], cap: float) -> float:
+    """`cap`, shortened to what is left of `deadline` if there is one"""
+    return cap if deadline is None else deadline.timeout(cap)
+
+
+def pool_task(fn: Callable) -> Callable:
+    """
+    Wrap work submitted to a long-lived pool thread so its database
+    connections are recycled the way Django does around each request;
+    otherwise every pool thread keeps its own connection open forever.
+    """
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return run
+
+
+class CircuitBreaker:
+    """
+    Per-process circuit breaker. Opens after `failure_threshold` consecutive
+    failures (calls slower than `slow_call_seconds` count as failures), rejects
+    calls while open, and after `reset_timeout` lets one half-open trial
+    through every `reset_timeout` seconds until a call succeeds again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, slow_call_seconds: float = 3,
+                 reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead; claims the half-open trial when one is due"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Restart the clock so only one trial goes through per interval
+                self.state = self.HALF_OPEN
+                self.opened_at = time.monotonic()
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self, seconds: float = 0.0):
+        if seconds > self.slow_call_seconds:
+            self.record_failure()
+            return
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold
+            ):
+                logger.warning(f"Circuit {self.name} opened after {self.consecutive_failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+            }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the
+    function and the callers arriving while it is in flight wait for and
+    share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run `fn` unless an identical call is in flight, in which case wait up
+        to `timeout` seconds for its result (concurrent.futures.TimeoutError).
+        """
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = Future()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return flight.result(timeout)
+
+        try:
+            result = fn()
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'in_flight': len(self._in_flight),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+            }
@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from django.conf import settings
+from django.core.cache import BaseCache, caches
+from .resilience import Deadline, pool_task
+
+logger = logging.getLogger(__name__)
+
+# Bump to invalidate every stored payload after a change to their layout
+RESPONSE_CACHE_VERSION = 1
+
+
+def get_response_backend() -> BaseCache:
+    """The 'spoonacular' cache alias, or the default cache if it is not configured"""
+    if 'spoonacular' in settings.CACHES:
+        return caches['spoonacular']
+    return caches['default']
+
+
+def search_cache_key(ingredient_names: Iterable[str], cuisine: Optional[str], max_results: int) -> str:
+    """Key for a findByIngredients result: normalized ingredient names, cuisine and result count"""
+    names = sorted({name.strip().lower() for name in ingredient_names if name and name.strip()})
+    canonical = f"{cuisine or ''}:{max_results}:{','.join(names)}"
+    return f"spoonacular:search:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+
+def recipe_cache_key(recipe_id: int) -> str:
+    """Key for a recipe information payload"""
+    return f"spoonacular:recipe:{recipe_id}"
+
+
+class ResponseCache:
+    """
+    Shared cache of raw Spoonacular payloads. Entries are fresh for `ttl`
+    seconds and then served stale for up to `stale` more seconds while a
+    background refresh fetches a new copy. Empty payloads, such as searches
+    without results, only live for `empty_ttl` seconds. Fetch callables take the deadline
+    to honour; background refreshes get None since they outlive the request.
+    With `lock` enabled, a worker missing some keys takes a short-lived lock
+    on them in the backend so other workers missing the same keys wait for
+    its result instead of fetching the same payloads.
+    """
+
+    def __init__(self, backend: BaseCache, executor: Optional[Executor] = None):
+        self.backend = backend
+        self.executor = executor
+        self.stale = getattr(settings, 'SPOONACULAR_CACHE_STALE', 24 * 3600)
+        self.empty_ttl = getattr(settings, 'SPOONACULAR_EMPTY_CACHE_TTL', 300)
+        self.lock = getattr(settings, 'SPOONACULAR_CACHE_LOCK', False)
+        self.lock_wait = getattr(settings, 'SPOONACULAR_CACHE_LOCK_WAIT', 5)
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.lock_waits = 0
+
+    def get(self, key: str, ttl: float, fetch: Callable[[Optional[Deadline]], Any],
+            deadline: Optional[Deadline] = None) -> Any:
+        """Return the cached payload for `key`, fetching and storing it on a miss"""
+        payload = self._lookup({key: key}, ttl, lambda missing, deadline: {key: fetch(deadline)}, deadline)
+        return payload.get(key)
+
+    def get_many(self, ids: List, key_of: Callable[[Any], str], ttl: float,
+                 fetch_many: Callable[[List, Optional[Deadline]], Dict[Any, Any]],
+                 deadline: Optional[Deadline] = None) -> Dict[Any, Any]:
+        """
+        Return cached payloads by id, fetching the missing ids with a single
+        `fetch_many(ids, deadline) -> {id: payload}` call. Ids the fetch does
+        not return are left out.
+        """
+        return self._lookup({key_of(item_id): item_id for item_id in ids}, ttl, fetch_many, deadline)
+
+    def _lookup(self, ids_by_key: Dict[str, Any], ttl: float,
+                fetch_many: Callable[[List, Optional[Deadline]], Dict[Any, Any]],
+                deadline: Optional[Deadline] = None) -> Dict[Any, Any]:
+        now = time.time()
+        found = {}
+        stale_ids = []
+        for key, entry in self.backend.get_many(list(ids_by_key), version=RESPONSE_CACHE_VERSION).items():
+            found[ids_by_key[key]] = entry['payload']
+            if now - entry['fetched_at'] >= ttl:
+                stale_ids.append(ids_by_key[key])
+
+        missing_ids = [item_id for key, item_id in ids_by_key.items() if item_id not in found]
+        with self._lock:
+            self.hits += len(found) - len(stale_ids)
+            self.stale_hits += len(stale_ids)
+            self.misses += len(missing_ids)
+
+        if missing_ids:
+            missing = {key: item_id for key, item_id in ids_by_key.items() if item_id in missing_ids}
+            found.update(self._fetch_missing(missing, ttl, fetch_many, deadline))
+        if stale_ids:
+            self._schedule_refresh(ids_by_key, stale_ids, ttl, fetch_many)
+        return found
+
+    def _fetch_missing(self, ids_by_key: Dict[str, Any], ttl: float,
+                       fetch_many: Callable[[List, Optional[Deadline]], Dict[Any, Any]],
+                       deadline: Optional[Deadline]) -> Dict[Any, Any]:
+        """
+        Fetch and store the missing entries. If another worker holds the lock
+        on the same keys, poll the backend for its result until the lock is
+        released or the wait ends, and only fetch what is still missing.
+        """
+        def fetch_and_store(item_ids: List) -> Dict[Any, Any]:
+            fetched = fetch_many(item_ids, deadline)
+            self._store(ids_by_key, fetched, ttl)
+            return fetched
+
+        if not self.lock:
+            return fetch_and_store(list(ids_by_key.values()))
+
+        keys = sorted(ids_by_key)
+        lock_key = f"spoonacular:lock:{hashlib.sha256(','.join(keys).encode('utf-8')).hexdigest()}"
+        # add() only succeeds for the first worker; the timeout frees the lock if it dies
+        if self.backend.add(lock_key, True, timeout=self.lock_wait, version=RESPONSE_CACHE_VERSION):
+            try:
+                return fetch_and_store(list(ids_by_key.values()))
+            finally:
+                self.backend.delete(lock_key, version=RESPONSE_CACHE_VERSION)
+
+        with self._lock:
+            self.lock_waits += 1
+        give_up_at = time.monotonic() + (self.lock_wait if deadline is None else deadline.timeout(self.lock_wait))
+        entries = {}
+        while time.monotonic() < give_up_at:
+            time.sleep(0.05)
+            # Check the lock before reading: the holder stores its result before releasing it
+            lock_held = self.backend.has_key(lock_key, version=RESPONSE_CACHE_VERSION)
+            entries = self.backend.get_many(keys, version=RESPONSE_CACHE_VERSION)
+            if len(entries) == len(keys) or not lock_held:
+                break
+
+        found = {ids_by_key[key]: entry['payload'] for key, entry in entries.items()}
+        still_missing = [item_id for item_id in ids_by_key.values() if item_id not in found]
+        if still_missing:
+            found.update(fetch_and_store(still_missing))
+        return found
+
+    def _store(self, ids_by_key: Dict[str, Any], payloads: Dict[Any, Any], ttl: float):
+        now = time.time()
+        entries = {
+            key: {'payload': payloads[item_id], 'fetched_at': now}
+            for key, item_id in ids_by_key.items()
+            if item_id in payloads
+        }
+        filled = {key: entry for key, entry in entries.items() if entry['payload']}
+        empty = {key: entry for key, entry in entries.items() if not entry['payload']}
+        if filled:
+            # The backend drops entries once they are past serving even stale
+            self.backend.set_many(filled, timeout=ttl + self.stale, version=RESPONSE_CACHE_VERSION)
+        if empty:
+            # Expire before going stale, so a later search that finds recipes is not hidden for long
+            self.backend.set_many(empty, timeout=min(ttl, self.empty_ttl), version=RESPONSE_CACHE_VERSION)
+
+    def _schedule_refresh(self, ids_by_key: Dict[str, Any], stale_ids: List, ttl: float,
+                          fetch_many: Callable[[List, Optional[Deadline]], Dict[Any, Any]]):
+        key_of = {item_id: key for key, item_id in ids_by_key.items()}
+        with self._lock:
+            stale_ids = [item_id for item_id in stale_ids if key_of[item_id] not in self._refreshing]
+            stale_keys = {key_of[item_id] for item_id in stale_ids}
+            self._refreshing.update(stale_keys)
+        if not stale_ids:
+            return
+
+        def refresh():
+            try:
+                self._store(ids_by_key, fetch_many(stale_ids, None), ttl)
+            except Exception as e:
+                logger.warning(f"Background refresh of stale Spoonacular entries failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.difference_update(stale_keys)
+
+        if self.executor is None:
+            refresh()
+        else:
+            self.executor.submit(pool_task(refresh))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'refreshing': len(self._refreshing),
+                'lock_waits': self.lock_waits,
+                'hit_rate': (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            }
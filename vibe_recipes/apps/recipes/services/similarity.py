@@ -0,0 +1,87 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from django.db import transaction
+from apps.recipes.models import SimilarRecipe
+from .index import IngredientIndex, get_ingredient_index
+
+logger = logging.getLogger(__name__)
+
+Neighbors = List[Tuple[int, float]]
+
+
+def compute_neighbors(index: IngredientIndex, recipe_ids: Iterable[int], n: Optional[int] = None,
+                      min_score: Optional[float] = None) -> Dict[int, Neighbors]:
+    """Top-n ingredient-similarity neighbors of each indexed recipe"""
+    n = n if n is not None else getattr(settings, 'SIMILAR_RECIPES_COUNT', 6)
+    min_score = min_score if min_score is not None else getattr(settings, 'SIMILAR_RECIPES_MIN_SCORE', 0.2)
+    neighbors = {}
+    for recipe_id in recipe_ids:
+        ingredient_ids = index.ingredients_of(recipe_id)
+        if ingredient_ids is not None:
+            neighbors[recipe_id] = index.similar_to(ingredient_ids, n, recipe_id, min_score)
+    return neighbors
+
+
+def store_neighbors(neighbors: Dict[int, Neighbors]):
+    """Replace the stored neighbors of the given recipes"""
+    batch_size = getattr(settings, 'RECIPE_WRITE_BATCH_SIZE', 500)
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe_id__in=neighbors.keys()).delete()
+        SimilarRecipe.objects.bulk_create(
+            [
+                SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id, score=score)
+                for recipe_id, similar in neighbors.items()
+                for similar_id, score in similar
+            ],
+            batch_size=batch_size,
+        )
+
+
+def refresh_similar_recipes(recipe_ids: Iterable[int]):
+    """
+    Incrementally (re)compute the neighbors of new or changed recipes, and
+    merge them into the stored lists of every recipe they are similar to,
+    since similarity is symmetric. That includes recipes outside their own
+    top n, whose lists may still be short or weaker. Recipes changed
+    elsewhere keep their lists until compute_similar_recipes runs again.
+    """
+    n = getattr(settings, 'SIMILAR_RECIPES_COUNT', 6)
+    index = get_ingredient_index()
+    # Every neighbor above the minimum score, not just the top n
+    candidates = compute_neighbors(index, recipe_ids, len(index.recipe_ids))
+    neighbors = {recipe_id: similar[:n] for recipe_id, similar in candidates.items()}
+    if not neighbors:
+        return
+
+    incoming: Dict[int, Dict[int, float]] = {}
+    for recipe_id, similar in candidates.items():
+        for similar_id, score in similar:
+            if similar_id not in neighbors:
+                incoming.setdefault(similar_id, {})[recipe_id] = score
+
+    merged = {}
+    stored: Dict[int, Dict[int, float]] = {recipe_id: {} for recipe_id in incoming}
+    for recipe_id, similar_id, score in SimilarRecipe.objects.filter(
+        recipe_id__in=incoming.keys()
+    ).values_list('recipe_id', 'similar_id', 'score'):
+        stored[recipe_id][similar_id] = score
+    for recipe_id, current in stored.items():
+        combined = {**current, **incoming[recipe_id]}
+        top = sorted(combined.items(), key=lambda item: (item[1], item[0]), reverse=True)[:n]
+        if dict(top) != current:
+            merged[recipe_id] = top
+
+    store_neighbors({**neighbors, **merged})
+    logger.debug(f"Refreshed similar recipes of {len(neighbors)} recipes, updated {len(merged)} neighbor lists")
+
+
+def refresh_similar_recipes_on_commit(recipe_id: int):
+    """Compute a newly written recipe's neighbors once its transaction commits, never failing the write"""
+    def refresh():
+        try:
+            refresh_similar_recipes([recipe_id])
+        except Exception as e:
+            logger.warning(f"Could not compute similar recipes for recipe {recipe_id}: {e}")
+
+    transaction.on_commit(refresh)
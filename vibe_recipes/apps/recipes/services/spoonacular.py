@@ -1,11 +1,87 @@
 import requests
 import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
 from typing import List, Dict, Optional
 from django.conf import settings
-from apps.recipes.models import Ingredient, Recipe, RecipeIngredient
+from django.db import IntegrityError
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from apps.recipes.models import Recipe
+from .ingredients import SelectedIngredients
+from .quota import get_spoonacular_quota
+from .resilience import CircuitBreaker, Deadline, SingleFlight, pool_task, remaining_timeout
+from .response_cache import ResponseCache, get_response_backend, recipe_cache_key, search_cache_key
+from .similarity import refresh_similar_recipes_on_commit
+from .writer import write_recipe
 
 logger = logging.getLogger(__name__)
 
+# Responses worth retrying: rate limiting and server-side failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Spoonacular answers 402 Payment Required once the daily points are spent
+QUOTA_EXHAUSTED_STATUS = 402
+# Answers meaning the informationBulk endpoint is not available to this key or proxy
+BULK_UNSUPPORTED_STATUSES = {404, 405}
+
+
+class QuotaExhausted(requests.exceptions.RequestException):
+    """Raised instead of calling Spoonacular when the shared daily points are spent"""
+
+
+class CallStats:
+    """Process-wide per-endpoint timing and point spend of Spoonacular calls"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Dict] = {}
+
+    def add(self, endpoint: str, seconds: float, retries: int, failed: bool, points: float = 0.0):
+        with self._lock:
+            entry = self._endpoints.setdefault(endpoint, {
+                'calls': 0, 'errors': 0, 'retries': 0, 'points': 0.0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+            })
+            entry['calls'] += 1
+            entry['errors'] += failed
+            entry['retries'] += retries
+            entry['points'] += points
+            entry['total_seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                endpoint: dict(entry, avg_seconds=entry['total_seconds'] / entry['calls'])
+                for endpoint, entry in self._endpoints.items()
+            }
+
+    def points_spent(self) -> float:
+        """Points Spoonacular charged for this process's calls so far"""
+        with self._lock:
+            return sum(entry['points'] for entry in self._endpoints.values())
+
+
+call_stats = CallStats()
+
+
+def retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - timezone.now()).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
 
 class SpoonacularAPI:
     """Service class for interacting with Spoonacular API"""
@@ -13,15 +89,160 @@ class SpoonacularAPI:
     def __init__(self):
         self.api_key = settings.SPOONACULAR_API_KEY
         self.base_url = settings.SPOONACULAR_BASE_URL
+        self.max_retries = getattr(settings, 'SPOONACULAR_MAX_RETRIES', 2)
+        self.backoff_base = getattr(settings, 'SPOONACULAR_BACKOFF_BASE', 0.5)
+        self.backoff_max = getattr(settings, 'SPOONACULAR_BACKOFF_MAX', 8)
+        
+        # One keep-alive session per process so calls reuse pooled connections
+        # instead of paying a TCP+TLS handshake each time
+        pool_size = getattr(settings, 'SPOONACULAR_POOL_SIZE', 10)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         
-    def search_recipes_by_ingredients(self, ingredient_names: List[str], cuisine: str = None, max_results: int = 5) -> List[Dict]:
+        # Raw payloads are cached so extraction changes apply without refetching
+        self.cache = ResponseCache(get_response_backend(), get_detail_executor())
+        self.search_ttl = getattr(settings, 'SPOONACULAR_SEARCH_CACHE_TTL', 24 * 3600)
+        self.recipe_ttl = getattr(settings, 'SPOONACULAR_RECIPE_CACHE_TTL', 7 * 24 * 3600)
+        
+        # Skips Spoonacular entirely while it keeps failing or responding slowly
+        self.breaker = CircuitBreaker(
+            'spoonacular',
+            failure_threshold=getattr(settings, 'SPOONACULAR_BREAKER_FAILURES', 5),
+            slow_call_seconds=getattr(settings, 'SPOONACULAR_BREAKER_SLOW_CALL', 3),
+            reset_timeout=getattr(settings, 'SPOONACULAR_BREAKER_RESET', 30),
+        )
+        
+        # Identical searches in flight at the same time share one upstream lookup
+        self.flights = SingleFlight()
+        
+        # Daily API points shared by every worker
+        self.quota = get_spoonacular_quota()
+    
+    def _get(self, endpoint: str, path: str, params: Dict, deadline: Optional[Deadline] = None,
+             timeout: float = 10, points: float = 1) -> requests.Response:
+        """
+        GET a Spoonacular path on the pooled session, retrying rate limits,
+        server errors and connection failures with jittered exponential
+        backoff, and recording the call timing. A Retry-After is honoured as
+        given, or the call gives up if it is longer than the backoff cap.
+        Each attempt's timeout is capped by what is left of `deadline`, and
+        no retry is attempted that could not finish before it. The estimated
+        `points` are taken from the shared quota before every attempt, settled
+        against the cost Spoonacular reports, and refunded when the attempt
+        gets no response at all; the points actually charged are recorded
+        with the call timing. A 402 drains the quota and raises
+        QuotaExhausted without touching the circuit breaker.
+        """
+        if deadline is not None and deadline.expired:
+            raise requests.exceptions.Timeout(f"Latency budget spent before Spoonacular {endpoint} call")
+        
+        started = time.monotonic()
+        attempt = 0
+        failed = True
+        charged = 0.0
+        try:
+            while True:
+                retry_delay = None
+                response = None
+                # requests rejects a zero timeout with ValueError, so a spent budget is a timeout here
+                attempt_timeout = remaining_timeout(deadline, timeout)
+                if attempt_timeout <= 0:
+                    raise requests.exceptions.Timeout(f"Latency budget spent before Spoonacular {endpoint} attempt")
+                # Every attempt, retries included, is charged by Spoonacular
+                if not self.quota.acquire(points):
+                    raise QuotaExhausted(f"Spoonacular quota spent, skipping {endpoint} call")
+                try:
+                    response = self.session.get(f"{self.base_url}/{path}", params=params, timeout=attempt_timeout)
+                    charged += self._settle_points(response, points)
+                    if response.status_code == QUOTA_EXHAUSTED_STATUS:
+                        raise QuotaExhausted(f"Spoonacular reports the daily quota as spent on {endpoint}")
+                    if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                        retry_delay = retry_after_seconds(response)
+                    else:
+                        response.raise_for_status()
+                        failed = False
+                        self.breaker.record_success(time.monotonic() - started)
+                        return response
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    # No response came back, so this attempt was not charged upstream
+                    self.quota.charge(-points)
+                    if attempt >= self.max_retries:
+                        raise
+                
+                # Full jitter, unless the server told us how long to wait
+                if retry_delay is None:
+                    retry_delay = min(random.uniform(0, self.backoff_base * 2 ** attempt), self.backoff_max)
+                elif retry_delay > self.backoff_max:
+                    # Retrying before the server's Retry-After would only be refused again
+                    logger.info(f"Spoonacular {endpoint} asked to wait {retry_delay:.0f}s, not retrying")
+                    response.raise_for_status()
+                if deadline is not None and retry_delay >= deadline.remaining():
+                    if response is not None:
+                        response.raise_for_status()
+                    raise requests.exceptions.Timeout(f"Latency budget too short to retry Spoonacular {endpoint}")
+                attempt += 1
+                logger.info(f"Retrying Spoonacular {endpoint} in {retry_delay:.2f}s (attempt {attempt})")
+                time.sleep(retry_delay)
+        except QuotaExhausted:
+            # Running out of points says nothing about the service's health
+            raise
+        except requests.exceptions.HTTPError as e:
+            # Client errors other than rate limiting mean the service itself is healthy
+            status = e.response.status_code if e.response is not None else None
+            if status is not None and status < 500 and status != 429:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            raise
+        except requests.exceptions.RequestException:
+            self.breaker.record_failure()
+            raise
+        finally:
+            call_stats.add(endpoint, time.monotonic() - started, attempt, failed, charged)
+    
+    def _settle_points(self, response: requests.Response, estimated: float) -> float:
         """
-        Search for recipes using the selected ingredients
+        Correct the quota by the points Spoonacular actually charged for a
+        call, and return them
+        """
+        if response.status_code == QUOTA_EXHAUSTED_STATUS:
+            logger.warning("Spoonacular reports the daily quota as spent")
+            self.quota.drain()
+            return 0.0
+        try:
+            charged = float(response.headers.get('X-API-Quota-Request', estimated))
+        except ValueError:
+            return estimated
+        if charged != estimated:
+            self.quota.charge(charged - estimated)
+        return charged
+    
+    def search_recipes_by_ingredients(self, ingredient_names: List[str], cuisine: str = None, max_results: int = 5,
+                                      deadline: Optional[Deadline] = None) -> List[Dict]:
+        """
+        Search for recipes using the selected ingredients. Concurrent searches
+        for the same normalized ingredients and cuisine are coalesced.
         """
         if not self.api_key:
             logger.warning("Spoonacular API key not configured")
             return []
-            
+        
+        cache_key = search_cache_key(ingredient_names, cuisine, max_results)
+        try:
+            return self.flights.do(
+                cache_key,
+                lambda: self._search(cache_key, ingredient_names, cuisine, max_results, deadline),
+                timeout=deadline.remaining() if deadline is not None else None,
+            )
+        except FutureTimeoutError:
+            logger.warning("Gave up waiting on an identical in-flight Spoonacular search")
+            return []
+    
+    def _search(self, cache_key: str, ingredient_names: List[str], cuisine: Optional[str], max_results: int,
+                deadline: Optional[Deadline]) -> List[Dict]:
+        """Run one findByIngredients search and fetch the top candidates' details"""
         try:
             # Prepare ingredients string (comma-separated)
             ingredients_str = ','.join(ingredient_names)
@@ -39,21 +260,26 @@ class SpoonacularAPI:
             if cuisine and cuisine != 'other':
                 params['cuisine'] = cuisine
             
-            # Make API request
-            url = f"{self.base_url}/findByIngredients"
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            recipes_data = response.json()
-            
-            # Get detailed recipe information for each recipe
-            detailed_recipes = []
-            for recipe in recipes_data[:3]:  # Limit to top 3 results
-                detailed_recipe = self.get_recipe_details(recipe['id'])
-                if detailed_recipe:
-                    detailed_recipes.append(detailed_recipe)
+            # Make API request, unless an equivalent search is cached
+            recipes_data = self.cache.get(
+                cache_key,
+                self.search_ttl,
+                lambda deadline: self._get(
+                    'findByIngredients', 'findByIngredients', params, deadline,
+                    points=1 + 0.01 * max_results,
+                ).json(),
+                deadline,
+            )
             
-            return detailed_recipes
+            # Get detailed recipe information for the top 3 results
+            candidate_ids = [recipe['id'] for recipe in recipes_data[:3]]
+            if getattr(settings, 'SPOONACULAR_USE_BULK', True):
+                detailed_recipes = self.get_recipes_details_bulk(candidate_ids, deadline)
+                # Per-recipe lookups only stand in when the bulk endpoint is unsupported;
+                # quota, breaker and deadline failures raise and end the search instead
+                if detailed_recipes is not None:
+                    return detailed_recipes
+            return self.get_recipes_details(candidate_ids, deadline)
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Error fetching recipes from Spoonacular: {str(e)}")
@@ -62,7 +288,67 @@ class SpoonacularAPI:
             logger.error(f"Unexpected error in Spoonacular API: {str(e)}")
             return []
     
-    def get_recipe_details(self, recipe_id: int) -> Optional[Dict]:
+    def get_recipes_details_bulk(self, recipe_ids: List[int], deadline: Optional[Deadline] = None) -> Optional[List[Dict]]:
+        """
+        Fetch details for several recipes with a single informationBulk call,
+        keeping the ranking order. Returns None if the bulk endpoint is
+        unsupported, so callers can fall back to per-recipe lookups; any
+        other failure is raised.
+        """
+        if not recipe_ids:
+            return []
+        
+        try:
+            # Only the ids without a cached payload are requested
+            details_by_id = self.cache.get_many(
+                recipe_ids, recipe_cache_key, self.recipe_ttl, self._fetch_details_bulk, deadline,
+            )
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status not in BULK_UNSUPPORTED_STATUSES:
+                raise
+            logger.warning(f"Spoonacular informationBulk unsupported (HTTP {status}), using per-recipe lookups")
+            return None
+        
+        return [
+            self._parse_recipe_details(details_by_id[recipe_id])
+            for recipe_id in recipe_ids
+            if recipe_id in details_by_id
+        ]
+    
+    def _fetch_details_bulk(self, recipe_ids: List[int], deadline: Optional[Deadline] = None) -> Dict[int, Dict]:
+        """Raw informationBulk payloads by recipe id"""
+        params = {
+            'apiKey': self.api_key,
+            'ids': ','.join(str(recipe_id) for recipe_id in recipe_ids),
+        }
+        # One point for the first recipe and half a point for each further one
+        response = self._get(
+            'informationBulk', 'informationBulk', params, deadline, points=1 + 0.5 * (len(recipe_ids) - 1),
+        )
+        # The bulk endpoint does not promise to keep the requested order
+        return {recipe_data.get('id'): recipe_data for recipe_data in response.json()}
+    
+    def get_recipes_details(self, recipe_ids: List[int], deadline: Optional[Deadline] = None) -> List[Dict]:
+        """
+        Fetch details for several recipes concurrently, keeping the ranking
+        order. Fetches that fail or miss the overall deadline are dropped.
+        """
+        wait_seconds = remaining_timeout(deadline, getattr(settings, 'SPOONACULAR_DETAILS_DEADLINE', 5))
+        executor = get_detail_executor()
+        # Detail fetches settle quota points in the database from the pool threads
+        fetch = pool_task(self.get_recipe_details)
+        futures = [executor.submit(fetch, recipe_id, deadline) for recipe_id in recipe_ids]
+        done, not_done = wait(futures, timeout=wait_seconds)
+        
+        for future in not_done:
+            future.cancel()
+        if not_done:
+            logger.warning(f"Dropped {len(not_done)} Spoonacular detail fetches after {wait_seconds:.2f}s deadline")
+        
+        return [future.result() for future in futures if future in done and future.result()]
+    
+    def get_recipe_details(self, recipe_id: int, deadline: Optional[Deadline] = None) -> Optional[Dict]:
         """
         Get detailed recipe information including instructions and image
         """
@@ -71,25 +357,14 @@ class SpoonacularAPI:
                 'apiKey': self.api_key,
             }
             
-            url = f"{self.base_url}/{recipe_id}/information"
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
+            recipe_data = self.cache.get(
+                recipe_cache_key(recipe_id),
+                self.recipe_ttl,
+                lambda deadline: self._get('information', f"{recipe_id}/information", params, deadline).json(),
+                deadline,
+            )
             
-            recipe_data = response.json()
-            
-            # Extract relevant information
-            return {
-                'id': recipe_data.get('id'),
-                'title': recipe_data.get('title'),
-                'image': recipe_data.get('image'),
-                'instructions': recipe_data.get('instructions', ''),
-                'ready_in_minutes': recipe_data.get('readyInMinutes', 30),
-                'servings': recipe_data.get('servings', 4),
-                'cuisine': self._extract_cuisine(recipe_data),
-                'ingredients': self._extract_ingredients(recipe_data),
-                'source_url': recipe_data.get('sourceUrl', ''),
-                'source_name': recipe_data.get('sourceName', ''),
-            }
+            return self._parse_recipe_details(recipe_data)
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Error fetching recipe details for ID {recipe_id}: {str(e)}")
@@ -98,6 +373,21 @@ class SpoonacularAPI:
             logger.error(f"Unexpected error getting recipe details: {str(e)}")
             return None
     
+    def _parse_recipe_details(self, recipe_data: Dict) -> Dict:
+        """Extract the fields we use from a raw recipe information payload"""
+        return {
+            'id': recipe_data.get('id'),
+            'title': recipe_data.get('title'),
+            'image': recipe_data.get('image'),
+            'instructions': recipe_data.get('instructions', ''),
+            'ready_in_minutes': recipe_data.get('readyInMinutes', 30),
+            'servings': recipe_data.get('servings', 4),
+            'cuisine': self._extract_cuisine(recipe_data),
+            'ingredients': self._extract_ingredients(recipe_data),
+            'source_url': recipe_data.get('sourceUrl', ''),
+            'source_name': recipe_data.get('sourceName', ''),
+        }
+    
     def _extract_cuisine(self, recipe_data: Dict) -> str:
         """Extract cuisine from recipe data"""
         cuisines = recipe_data.get('cuisines', [])
@@ -134,10 +424,64 @@ class SpoonacularAPI:
         return ingredients
 
 
+_api: Optional[SpoonacularAPI] = None
+_api_lock = threading.Lock()
+
+
+def get_api() -> SpoonacularAPI:
+    """Return the process-wide Spoonacular client and its connection pool"""
+    global _api
+    if _api is None:
+        with _api_lock:
+            if _api is None:
+                _api = SpoonacularAPI()
+    return _api
+
+
+def reset_api():
+    """Drop the process-wide client, e.g. after changing Spoonacular settings"""
+    global _api
+    with _api_lock:
+        if _api is not None:
+            _api.session.close()
+        _api = None
+
+
+_detail_executor: Optional[ThreadPoolExecutor] = None
+_detail_executor_lock = threading.Lock()
+
+
+def get_detail_executor() -> ThreadPoolExecutor:
+    """Bounded, process-wide thread pool for Spoonacular detail requests"""
+    global _detail_executor
+    if _detail_executor is None:
+        with _detail_executor_lock:
+            if _detail_executor is None:
+                _detail_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'SPOONACULAR_DETAIL_WORKERS', 4),
+                    thread_name_prefix='spoonacular',
+                )
+    return _detail_executor
+
+
+def is_import_fresh(recipe: Recipe) -> bool:
+    """Whether an imported recipe is recent enough to reuse without refreshing"""
+    if not recipe.imported_at:
+        return False
+    max_age = getattr(settings, 'SPOONACULAR_REFRESH_AGE', 7 * 24 * 3600)
+    return timezone.now() - recipe.imported_at < timedelta(seconds=max_age)
+
+
 def create_recipe_from_spoonacular(recipe_data: Dict, selected_ingredients: List[int], user=None) -> Recipe:
     """
-    Create a Recipe object from Spoonacular data
+    Create a Recipe object from Spoonacular data, reusing the existing import
+    of the same Spoonacular recipe and only refreshing it once it is stale
     """
+    spoonacular_id = recipe_data.get('id')
+    existing = Recipe.objects.filter(spoonacular_id=spoonacular_id).first() if spoonacular_id else None
+    if existing and is_import_fresh(existing):
+        return existing
+    
     # Determine difficulty based on cooking time
     cooking_time = recipe_data.get('ready_in_minutes', 30)
     if cooking_time <= 30:
@@ -147,50 +491,62 @@ def create_recipe_from_spoonacular(recipe_data: Dict, selected_ingredients: List
     else:
         difficulty = 'hard'
     
-    # Create the recipe
-    recipe = Recipe.objects.create(
-        title=recipe_data.get('title', 'Unknown Recipe'),
-        cuisine=recipe_data.get('cuisine', 'other'),
-        description=f"A delicious recipe from {recipe_data.get('source_name', 'Spoonacular')}",
-        instructions=recipe_data.get('instructions', ''),
-        cooking_time=cooking_time,
-        difficulty=difficulty,
-        image_url=recipe_data.get('image', ''),
-        is_generated=True
-    )
-    
-    # Add ingredients to recipe
-    for ingredient_info in recipe_data.get('ingredients', []):
-        ingredient_name = ingredient_info.get('name', '').lower()
-        
-        # Try to find existing ingredient or create new one
-        ingredient, created = Ingredient.objects.get_or_create(
-            name=ingredient_name,
-            defaults={'category': 'other'}
-        )
-        
-        # Create recipe ingredient relationship
-        RecipeIngredient.objects.create(
-            recipe=recipe,
-            ingredient=ingredient,
-            quantity=str(ingredient_info.get('amount', '')),
-            unit=ingredient_info.get('unit', '')
-        )
+    fields = {
+        'title': recipe_data.get('title', 'Unknown Recipe'),
+        'cuisine': recipe_data.get('cuisine', 'other'),
+        'description': f"A delicious recipe from {recipe_data.get('source_name', 'Spoonacular')}",
+        'instructions': recipe_data.get('instructions', ''),
+        'cooking_time': cooking_time,
+        'difficulty': difficulty,
+        'image_url': recipe_data.get('image', ''),
+        'is_generated': True,
+        'imported_at': timezone.now(),
+    }
+    
+    ingredient_rows = [
+        {
+            'name': ingredient_info.get('name', '').lower(),
+            'quantity': str(ingredient_info.get('amount', '')),
+            'unit': ingredient_info.get('unit', ''),
+        }
+        for ingredient_info in recipe_data.get('ingredients', [])
+    ]
+    if not existing:
+        fields['spoonacular_id'] = spoonacular_id
+    
+    try:
+        # Refresh the stale import in place, or create it
+        recipe = write_recipe(fields, ingredient_rows, recipe=existing).recipe
+    except IntegrityError:
+        # Another request imported the same Spoonacular recipe concurrently;
+        # any other constraint failure is a real error
+        concurrent = Recipe.objects.filter(spoonacular_id=spoonacular_id).first() if spoonacular_id else None
+        if concurrent is None:
+            raise
+        return concurrent
     
+    refresh_similar_recipes_on_commit(recipe.id)
     return recipe
 
 
-def get_spoonacular_recipes(selected_ingredients: List[int], cuisine: str) -> List[Dict]:
+def get_spoonacular_recipes(selected_ingredients: List[int], cuisine: str, deadline: Optional[Deadline] = None,
+                            selection: Optional[SelectedIngredients] = None) -> List[Dict]:
     """
-    Main function to get recipes from Spoonacular API
+    Main function to get recipes from Spoonacular API. Returns nothing while
+    the circuit breaker is open or once a call finds the daily quota spent,
+    so callers fall back to local matching. Pass the request's `selection`
+    to reuse its already loaded ingredients.
     """
-    api = SpoonacularAPI()
+    api = get_api()
+    if not api.breaker.allow():
+        logger.info("Spoonacular circuit open, skipping to local matching")
+        return []
     
     # Get ingredient names
-    ingredients = Ingredient.objects.filter(id__in=selected_ingredients)
-    ingredient_names = [ing.name for ing in ingredients]
+    if selection is None:
+        selection = SelectedIngredients.load(selected_ingredients)
     
     # Search for recipes
-    recipes = api.search_recipes_by_ingredients(ingredient_names, cuisine)
+    recipes = api.search_recipes_by_ingredients(selection.names, cuisine, deadline=deadline)
     
     return recipes
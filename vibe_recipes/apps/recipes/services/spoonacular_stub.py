@@ -0,0 +1,236 @@
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+import requests
+from django.db import connection
+from django.db.models.functions import Lower
+from apps.recipes.models import Ingredient, Recipe, RecipeIngredient
+
+logger = logging.getLogger(__name__)
+
+FIND_PATH = re.compile(r'/findByIngredients/?$')
+BULK_PATH = re.compile(r'/informationBulk/?$')
+INFORMATION_PATH = re.compile(r'/(\d+)/information/?$')
+
+# Synthetic Spoonacular ids are local recipe ids shifted into their own range,
+# so imports of stub answers never reuse a local primary key as spoonacular_id
+SYNTHETIC_ID_OFFSET = 10_000_000
+
+
+class StubConfig(NamedTuple):
+    """
+    How the stub answers. `mode` is 'synthetic' (answer from the local
+    recipe catalog), 'replay' (answer from recorded fixtures, 404 when none
+    exists) or 'record' (replay, fetching and recording misses upstream).
+    """
+    mode: str = 'synthetic'
+    fixtures_dir: Optional[Path] = None
+    upstream_url: str = 'https://api.spoonacular.com/recipes'
+    latency_ms: float = 0
+    jitter_ms: float = 0
+    error_rate: float = 0
+    error_status: int = 500
+
+
+def fixture_key(endpoint: str, params: Dict[str, str]) -> str:
+    """Stable fixture name for a request, ignoring the API key and list order"""
+    normalized = {}
+    for name, value in params.items():
+        if name == 'apiKey':
+            continue
+        if name in ('ingredients', 'ids'):
+            value = ','.join(sorted(part.strip().lower() for part in value.split(',') if part.strip()))
+        normalized[name] = value
+    canonical = json.dumps([endpoint, normalized], sort_keys=True)
+    return f"{endpoint.replace('/', '_')}-{hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]}"
+
+
+def recipe_payload(recipe: Recipe, recipe_ingredients: List[RecipeIngredient]) -> Dict:
+    """A recipe information payload shaped like Spoonacular's, from a local recipe"""
+    return {
+        'id': SYNTHETIC_ID_OFFSET + recipe.id,
+        'title': recipe.title,
+        'image': recipe.image_url or '',
+        'instructions': recipe.instructions,
+        'readyInMinutes': recipe.cooking_time or 30,
+        'servings': 4,
+        'cuisines': [recipe.get_cuisine_display()] if recipe.cuisine != 'other' else [],
+        'extendedIngredients': [
+            {
+                'name': recipe_ingredient.ingredient.name,
+                'amount': recipe_ingredient.quantity,
+                'unit': recipe_ingredient.unit or '',
+                'original': ' '.join(
+                    part for part in (recipe_ingredient.quantity, recipe_ingredient.unit,
+                                      recipe_ingredient.ingredient.name) if part
+                ),
+            }
+            for recipe_ingredient in recipe_ingredients
+        ],
+        'sourceUrl': '',
+        'sourceName': 'Spoonacular stub',
+    }
+
+
+class SyntheticCatalog:
+    """
+    Answers stub requests from the local recipe catalog. Recipes imported
+    from Spoonacular (including earlier stub answers) are never served, so
+    repeated runs do not feed on their own imports; benchmarks should still
+    run against a scratch database, since every generate run imports recipes.
+    """
+
+    def find_by_ingredients(self, params: Dict[str, str]) -> List[Dict]:
+        from .generator import match_recipes
+
+        names = [name.strip().lower() for name in params.get('ingredients', '').split(',') if name.strip()]
+        selected = list(
+            Ingredient.objects.annotate(lower_name=Lower('name')).filter(lower_name__in=names).values_list('id', flat=True)
+        )
+        cuisine = params.get('cuisine') or None
+        number = int(params.get('number', 10))
+        matches = []
+        if selected:
+            # Ask for enough matches to still have `number` once imports are left out
+            imported = Recipe.objects.filter(spoonacular_id__isnull=False).count()
+            matches = [
+                match for match in match_recipes(selected, cuisine, k=number + imported)
+                if match.recipe.spoonacular_id is None
+            ][:number]
+        return [
+            {
+                'id': SYNTHETIC_ID_OFFSET + match.recipe.id,
+                'title': match.recipe.title,
+                'image': match.recipe.image_url or '',
+                'usedIngredientCount': match.matching,
+                'missedIngredientCount': match.missing,
+                'likes': 0,
+            }
+            for match in matches
+        ]
+
+    def information(self, synthetic_ids: List[int]) -> List[Dict]:
+        recipe_ids = [synthetic_id - SYNTHETIC_ID_OFFSET for synthetic_id in synthetic_ids]
+        recipes = Recipe.objects.filter(spoonacular_id__isnull=True).in_bulk(
+            [recipe_id for recipe_id in recipe_ids if recipe_id > 0]
+        )
+        ingredients_by_recipe = {}
+        for recipe_ingredient in RecipeIngredient.objects.filter(recipe_id__in=recipes).select_related('ingredient'):
+            ingredients_by_recipe.setdefault(recipe_ingredient.recipe_id, []).append(recipe_ingredient)
+        return [
+            recipe_payload(recipes[recipe_id], ingredients_by_recipe.get(recipe_id, []))
+            for recipe_id in recipe_ids
+            if recipe_id in recipes
+        ]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves findByIngredients, {id}/information and informationBulk"""
+
+    protocol_version = 'HTTP/1.1'
+    config: StubConfig = StubConfig()
+    catalog = SyntheticCatalog()
+
+    def log_message(self, format, *args):
+        logger.debug(f"Stub {self.address_string()} {format % args}")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            self._inject_latency()
+            if self.config.error_rate and random.random() < self.config.error_rate:
+                self._send(self.config.error_status, {'status': 'failure', 'message': 'Injected error'})
+                return
+            status, body, points = self._answer(url.path, params)
+            self._send(status, body, points)
+        except Exception as e:
+            logger.exception(f"Stub failed to answer {url.path}")
+            self._send(500, {'status': 'failure', 'message': str(e)})
+        finally:
+            # Each request runs on its own thread and so its own connection
+            connection.close()
+
+    def _inject_latency(self):
+        delay = random.gauss(self.config.latency_ms, self.config.jitter_ms) if self.config.jitter_ms else self.config.latency_ms
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _answer(self, path: str, params: Dict[str, str]) -> Tuple[int, object, float]:
+        information = INFORMATION_PATH.search(path)
+        if FIND_PATH.search(path):
+            endpoint, points = 'findByIngredients', 1 + 0.01 * int(params.get('number', 10))
+        elif BULK_PATH.search(path):
+            ids = [part for part in params.get('ids', '').split(',') if part.strip()]
+            endpoint, points = 'informationBulk', 1 + 0.5 * max(0, len(ids) - 1)
+        elif information:
+            endpoint, points = f"{information.group(1)}/information", 1
+        else:
+            return 404, {'status': 'failure', 'message': f'Unknown endpoint {path}'}, 0
+
+        if self.config.mode == 'synthetic':
+            status, body = self._synthetic(endpoint, params)
+        else:
+            status, body = self._replay(endpoint, params)
+        return status, body, points
+
+    def _synthetic(self, endpoint: str, params: Dict[str, str]) -> Tuple[int, object]:
+        if endpoint == 'findByIngredients':
+            return 200, self.catalog.find_by_ingredients(params)
+        if endpoint == 'informationBulk':
+            ids = [int(part) for part in params.get('ids', '').split(',') if part.strip()]
+            return 200, self.catalog.information(ids)
+        payloads = self.catalog.information([int(endpoint.split('/')[0])])
+        if not payloads:
+            return 404, {'status': 'failure', 'message': 'Recipe not found'}
+        return 200, payloads[0]
+
+    def _replay(self, endpoint: str, params: Dict[str, str]) -> Tuple[int, object]:
+        fixture = self.config.fixtures_dir / f"{fixture_key(endpoint, params)}.json"
+        if fixture.exists():
+            recorded = json.loads(fixture.read_text())
+            return recorded['status'], recorded['body']
+        if self.config.mode != 'record':
+            return 404, {'status': 'failure', 'message': f'No fixture recorded for {endpoint}'}
+
+        response = requests.get(f"{self.config.upstream_url}/{endpoint}", params=params, timeout=30)
+        body = response.json()
+        if response.ok:
+            # Only successes are kept, so a transient upstream failure is not replayed forever
+            fixture.parent.mkdir(parents=True, exist_ok=True)
+            fixture.write_text(json.dumps({
+                'endpoint': endpoint,
+                'params': {name: value for name, value in params.items() if name != 'apiKey'},
+                'status': response.status_code,
+                'body': body,
+            }, indent=2))
+        return response.status_code, body
+
+    def _send(self, status: int, body, points: float = 0):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        if points:
+            self.send_header('X-API-Quota-Request', f'{points:g}')
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def make_stub_server(host: str, port: int, config: StubConfig) -> ThreadingHTTPServer:
+    """Bind a stub server; call serve_forever() (or run it on a thread) to start answering"""
+    if config.mode not in ('synthetic', 'replay', 'record'):
+        raise ValueError(f"Unknown stub mode {config.mode}")
+    if config.mode != 'synthetic' and config.fixtures_dir is None:
+        raise ValueError(f"The {config.mode} mode needs a fixtures directory")
+    handler = type('ConfiguredStubHandler', (StubHandler,), {'config': config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
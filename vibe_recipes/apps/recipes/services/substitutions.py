@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from django.conf import settings
+from apps.recipes.models import Ingredient, IngredientSubstitution
+
+logger = logging.getLogger(__name__)
+
+# Default swaps seeded into the graph by name, better options first
+DEFAULT_SUBSTITUTIONS = {
+    'cream': ['milk', 'butter'],
+    'milk': ['cream', 'yogurt'],
+    'butter': ['olive oil', 'vegetable oil'],
+    'beef': ['mushroom', 'tofu', 'lentils'],
+    'chicken': ['tofu', 'mushroom', 'chickpeas'],
+    'eggs': ['flax seeds', 'banana'],
+    'cheese': ['nutritional yeast', 'tofu'],
+    'garlic': ['garlic powder', 'onion'],
+    'onion': ['garlic', 'shallot'],
+    'tomato': ['bell pepper', 'carrot'],
+    'pasta': ['rice', 'quinoa'],
+    'rice': ['quinoa', 'couscous'],
+    'bread': ['tortilla', 'lettuce'],
+}
+
+
+def seed_default_substitutions() -> int:
+    """
+    Link the DEFAULT_SUBSTITUTIONS entries whose ingredients both exist,
+    keeping existing edges. Safe to run repeatedly, e.g. after loading
+    ingredients. Returns the number of edges considered.
+    """
+    ids = {}
+    for ingredient_id, name in Ingredient.objects.order_by('-id').values_list('id', 'name'):
+        ids[name.strip().lower()] = ingredient_id
+
+    edges = []
+    for name, substitutes in DEFAULT_SUBSTITUTIONS.items():
+        if name not in ids:
+            continue
+        for position, substitute in enumerate(substitutes):
+            if substitute in ids:
+                edges.append(IngredientSubstitution(
+                    ingredient_id=ids[name],
+                    substitute_id=ids[substitute],
+                    weight=round(0.9 - 0.1 * position, 2),
+                ))
+    IngredientSubstitution.objects.bulk_create(edges, ignore_conflicts=True)
+    # bulk_create skips the signals that reset this worker's graph
+    reset_substitution_graph()
+    return len(edges)
+
+
+class SubstitutionGraph:
+    """
+    Per-worker adjacency structure of IngredientSubstitution edges, keyed by
+    ingredient id. The transitive closure up to `max_hops` swaps is computed
+    once at load, keeping for every reachable substitute the best product
+    of edge weights, so lookups are plain dict and set operations.
+    """
+
+    def __init__(self, edges: Iterable[Tuple[int, int, float]] = (), max_hops: int = 2):
+        self.max_hops = max_hops
+        self.adjacency: Dict[int, Dict[int, float]] = {}
+        for ingredient_id, substitute_id, weight in edges:
+            if ingredient_id != substitute_id and weight > 0:
+                self.adjacency.setdefault(ingredient_id, {})[substitute_id] = weight
+        self.closure = self._close()
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def load(cls, max_hops: int = 2) -> 'SubstitutionGraph':
+        return cls(IngredientSubstitution.objects.values_list('ingredient_id', 'substitute_id', 'weight'), max_hops)
+
+    def _close(self) -> Dict[int, Dict[int, float]]:
+        """Best weight of every substitute reachable within max_hops swaps"""
+        closure = {}
+        for source, direct in self.adjacency.items():
+            best = dict(direct)
+            frontier = dict(direct)
+            for _ in range(self.max_hops - 1):
+                extended = {}
+                for node, weight in frontier.items():
+                    for substitute, edge_weight in self.adjacency.get(node, {}).items():
+                        chained = weight * edge_weight
+                        if substitute != source and chained > best.get(substitute, 0) and chained > extended.get(substitute, 0):
+                            extended[substitute] = chained
+                if not extended:
+                    break
+                best.update(extended)
+                frontier = extended
+            closure[source] = best
+        return closure
+
+    def substitutes(self, ingredient_id: int) -> Dict[int, float]:
+        """Substitutes reachable from an ingredient, with their best chained weight"""
+        return self.closure.get(ingredient_id, {})
+
+    def resolve(self, missing: Iterable[int], available: Iterable[int]) -> Dict[int, List[int]]:
+        """
+        Map each missing ingredient id to the available ids that can replace
+        it, best weight first. Missing ingredients without one are left out.
+        """
+        available = set(available)
+        resolved = {}
+        for ingredient_id in missing:
+            reachable = self.closure.get(ingredient_id)
+            usable = reachable.keys() & available if reachable else None
+            if usable:
+                resolved[ingredient_id] = sorted(usable, key=lambda substitute: (-reachable[substitute], substitute))
+        return resolved
+
+    def count_coverable(self, missing: Iterable[int], available: Set[int]) -> int:
+        """How many of the missing ingredients some available ingredient can replace"""
+        return sum(
+            1 for ingredient_id in missing
+            if ingredient_id in self.closure and not self.closure[ingredient_id].keys().isdisjoint(available)
+        )
+
+    def stats(self) -> Dict:
+        return {
+            'ingredients': len(self.adjacency),
+            'edges': sum(len(direct) for direct in self.adjacency.values()),
+            'closure_pairs': sum(len(reachable) for reachable in self.closure.values()),
+            'max_hops': self.max_hops,
+            'age_seconds': round(time.monotonic() - self.loaded_at, 1),
+        }
+
+
+_graph: Optional[SubstitutionGraph] = None
+_graph_lock = threading.Lock()
+
+
+def get_substitution_graph() -> SubstitutionGraph:
+    """
+    Return the process-wide substitution graph, reloading it once it is
+    older than SUBSTITUTION_GRAPH_TTL so other workers' edits show up.
+    """
+    global _graph
+    ttl = getattr(settings, 'SUBSTITUTION_GRAPH_TTL', 300)
+    with _graph_lock:
+        if _graph is None or time.monotonic() - _graph.loaded_at >= ttl:
+            _graph = SubstitutionGraph.load(getattr(settings, 'SUBSTITUTION_MAX_HOPS', 2))
+            logger.debug(f"Loaded substitution graph: {_graph.stats()}")
+        return _graph
+
+
+def reset_substitution_graph():
+    """Drop the process-wide graph so the next lookup reloads it"""
+    global _graph
+    with _graph_lock:
+        _graph = None
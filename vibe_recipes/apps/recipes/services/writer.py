@@ -0,0 +1,105 @@
+import logging
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from django.conf import settings
+from django.db import connection, transaction
+from apps.recipes.models import Recipe, RecipeIngredient
+from .index import batch_catalog_changes, record_catalog_change
+from .ingredients import get_ingredient_resolver
+
+logger = logging.getLogger(__name__)
+
+
+class StatementCounter:
+    """Database execute wrapper counting the SQL statements issued inside it"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class WriteResult(NamedTuple):
+    """Outcome of a recipe write and the number of statements it cost"""
+    recipe: Recipe
+    created: bool
+    statements: int
+
+
+class WriteStats:
+    """Process-wide totals of recipe writes, to track write amplification"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.recipes = 0
+        self.statements = 0
+
+    def add(self, statements: int):
+        with self._lock:
+            self.recipes += 1
+            self.statements += statements
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'recipes': self.recipes,
+                'statements': self.statements,
+                'statements_per_recipe': self.statements / self.recipes if self.recipes else 0.0,
+            }
+
+
+write_stats = WriteStats()
+
+
+def resolve_ingredients(names: Iterable[str], category: str = 'other') -> Dict[str, int]:
+    """
+    Map raw ingredient names to canonical ingredient ids in bulk, so name
+    variants ("Tomatoes", "ripe tomato") share one ingredient and only the
+    genuinely new ones are created.
+    """
+    return get_ingredient_resolver().resolve(names, category)
+
+
+def write_recipe(fields: Dict, ingredient_rows: List[Dict], recipe: Optional[Recipe] = None) -> WriteResult:
+    """
+    Create a recipe (or overwrite `recipe`) with its ingredients in a single
+    transaction. Each ingredient row holds either an 'ingredient' instance or
+    a 'name' to resolve, plus optional 'quantity' and 'unit'.
+    """
+    counter = StatementCounter()
+    batch_size = getattr(settings, 'RECIPE_WRITE_BATCH_SIZE', 500)
+    created = recipe is None
+
+    with connection.execute_wrapper(counter), transaction.atomic(), batch_catalog_changes():
+        if created:
+            recipe = Recipe.objects.create(**fields)
+        else:
+            for field, value in fields.items():
+                setattr(recipe, field, value)
+            recipe.save()
+            RecipeIngredient.objects.filter(recipe=recipe).delete()
+
+        resolved = resolve_ingredients(row['name'] for row in ingredient_rows if 'ingredient' not in row)
+        links = []
+        linked = set()
+        for row in ingredient_rows:
+            ingredient_id = row['ingredient'].id if 'ingredient' in row else resolved.get(row.get('name'))
+            # Variants of one ingredient in the same recipe collapse into a single row
+            if ingredient_id is None or ingredient_id in linked:
+                continue
+            linked.add(ingredient_id)
+            links.append(RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                quantity=row.get('quantity'),
+                unit=row.get('unit'),
+            ))
+        RecipeIngredient.objects.bulk_create(links, batch_size=batch_size)
+        # bulk_create skips post_save, so log the recipe for the matcher index
+        record_catalog_change([recipe.id])
+
+    write_stats.add(counter.count)
+    logger.info(f"Wrote recipe {recipe.id} with {len(links)} ingredients in {counter.count} statements")
+    return WriteResult(recipe, created, counter.count)
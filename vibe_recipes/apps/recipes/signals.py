@@ -0,0 +1,50 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from .models import Ingredient, IngredientAlias, IngredientSubstitution, Recipe, RecipeIngredient
+from .services.index import record_catalog_change
+from .services.ingredients import get_ingredient_resolver
+from .services.substitutions import reset_substitution_graph
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    """Cuisine and cooking time feed the matcher, so any recipe write is a change"""
+    record_catalog_change([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    """Covers generator writes as well as admin edits through RecipeIngredientInline"""
+    record_catalog_change([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_ingredients_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """recipe.ingredients.add()/remove()/clear() write through rows without post_save"""
+    if reverse and action == 'pre_clear':
+        # The affected recipes are unknown once an ingredient's rows are cleared
+        instance._cleared_recipe_ids = list(
+            RecipeIngredient.objects.filter(ingredient=instance).values_list('recipe_id', flat=True)
+        )
+    elif reverse and action == 'post_clear':
+        record_catalog_change(getattr(instance, '_cleared_recipe_ids', []))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        record_catalog_change((pk_set or []) if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=IngredientAlias)
+@receiver(post_delete, sender=IngredientAlias)
+def ingredient_names_changed(sender, instance, **kwargs):
+    """Renames and new aliases apply to this worker's resolver immediately"""
+    get_ingredient_resolver().clear()
+
+
+@receiver(post_save, sender=IngredientSubstitution)
+@receiver(post_delete, sender=IngredientSubstitution)
+def substitutions_changed(sender, instance, **kwargs):
+    """Edits apply to this worker's graph immediately, other workers reload after SUBSTITUTION_GRAPH_TTL"""
+    reset_substitution_graph()
@@ -1,3 +1,848 @@
-from django.test import TestCase
+import tempfile
+import threading
+from io import StringIO
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Ingredient, IngredientAlias, Recipe, RecipeCatalogChange, RecipeIngredient, SimilarRecipe, UserRecipeHistory,
+)
+from .services.cooccurrence import CooccurrenceMatrix
+from .services.cache import get_generate_cache
+from .services.generator import generate_recipe, match_recipes, pantry_recipes, recipe_fingerprint, synthesize_recipe
+from .services.index import get_ingredient_index, reset_ingredient_index
+from .services.ingredients import IngredientResolver, clean_ingredient_name, normalize_ingredient_name
+from .services import generator, quota, resilience, spoonacular
+from .services.quota import TokenBucket
+from .services.resilience import CircuitBreaker, Deadline
+from .services.similarity import refresh_similar_recipes
+from .services.spoonacular import QuotaExhausted, SpoonacularAPI, create_recipe_from_spoonacular
+from .services.spoonacular_stub import SYNTHETIC_ID_OFFSET, StubConfig, make_stub_server
+from .services.substitutions import reset_substitution_graph
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'spoonacular': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-spoonacular'},
+}
+
+
+class MatcherBackendTests(TestCase):
+    """The in-memory index must rank exactly like the grouped database query"""
+
+    QUERIES = [
+        ['garlic'],
+        ['garlic', 'tomato'],
+        ['garlic', 'tomato', 'basil', 'pasta'],
+        ['rice', 'soy sauce', 'ginger'],
+        ['chicken', 'rice', 'garlic', 'ginger', 'lime'],
+        ['lime'],
+    ]
+
+    def setUp(self):
+        reset_ingredient_index()
+        reset_substitution_graph()
+        self.ingredients = {
+            name: Ingredient.objects.create(name=name)
+            for name in ['garlic', 'tomato', 'basil', 'pasta', 'rice', 'soy sauce', 'ginger', 'chicken', 'lime']
+        }
+        # Same ingredients and cooking time in one cuisine, so only the id breaks the tie
+        self.add_recipe('Tomato Pasta', 'italian', 20, ['garlic', 'tomato', 'pasta'])
+        self.add_recipe('Tomato Pasta Again', 'italian', 20, ['garlic', 'tomato', 'pasta'])
+        self.add_recipe('Quick Tomato Pasta', 'italian', 10, ['garlic', 'tomato', 'pasta'])
+        # A missing cooking time ranks like zero minutes
+        self.add_recipe('Bruschetta', 'italian', None, ['garlic', 'tomato', 'basil'])
+        self.add_recipe('Pesto Pasta', 'italian', 15, ['garlic', 'basil', 'pasta'])
+        self.add_recipe('Garlic Rice', 'chinese', 15, ['garlic', 'rice'])
+        self.add_recipe('Ginger Chicken', 'chinese', 30, ['chicken', 'ginger', 'soy sauce', 'rice', 'garlic'])
+        self.add_recipe('Lime Rice', 'thai', 0, ['rice', 'lime'])
+        self.add_recipe('Thai Chicken', 'thai', 25, ['chicken', 'lime', 'ginger', 'garlic'])
+
+    def tearDown(self):
+        reset_ingredient_index()
+        reset_substitution_graph()
+
+    def add_recipe(self, title, cuisine, cooking_time, ingredient_names):
+        recipe = Recipe.objects.create(title=title, cuisine=cuisine, cooking_time=cooking_time, instructions='Cook.')
+        for name in ingredient_names:
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=self.ingredients[name])
+        return recipe
+
+    def ranking(self, names, cuisine=None, k=5, backend='index'):
+        selected = [self.ingredients[name].id for name in names]
+        return [
+            (match.recipe.title, match.matching, match.missing, match.coverage)
+            for match in match_recipes(selected, cuisine, k, backend=backend)
+        ]
+
+    def assertSameRanking(self, names, cuisine=None, k=5):
+        self.assertEqual(
+            self.ranking(names, cuisine, k, backend='index'),
+            self.ranking(names, cuisine, k, backend='database'),
+            f"{names} in {cuisine or 'any cuisine'}, k={k}",
+        )
+
+    def pantry(self, names, cuisine=None, limit=50, backend='index'):
+        selected = [self.ingredients[name].id for name in names]
+        return [
+            (match.recipe.title, match.matching, match.coverage)
+            for match in pantry_recipes(selected, cuisine, limit, backend=backend)
+        ]
+
+    def assertSamePantry(self, names, cuisine=None, limit=50):
+        self.assertEqual(
+            self.pantry(names, cuisine, limit, backend='index'),
+            self.pantry(names, cuisine, limit, backend='database'),
+            f"{names} in {cuisine or 'any cuisine'}, limit={limit}",
+        )
+
+    def test_backends_agree(self):
+        for names in self.QUERIES:
+            for k in (1, 3, 10):
+                self.assertSameRanking(names, k=k)
+
+    def test_backends_agree_within_cuisine(self):
+        for names in self.QUERIES:
+            for cuisine in ('italian', 'chinese', 'thai', 'mexican'):
+                self.assertSameRanking(names, cuisine)
+
+    def test_ties_break_on_cooking_time_then_newest(self):
+        self.assertEqual(
+            [title for title, *_ in self.ranking(['garlic', 'tomato'], 'italian')],
+            ['Bruschetta', 'Quick Tomato Pasta', 'Tomato Pasta Again', 'Tomato Pasta', 'Pesto Pasta'],
+        )
+
+    def test_index_picks_up_catalog_changes(self):
+        self.ranking(['garlic'])
+        self.add_recipe('Garlic Soup', 'french', 5, ['garlic'])
+        Recipe.objects.get(title='Bruschetta').delete()
+        for names in self.QUERIES:
+            self.assertSameRanking(names, k=10)
+        self.assertEqual(self.ranking(['garlic'], k=1)[0][0], 'Garlic Soup')
+
+    def test_pantry_backends_agree(self):
+        pantries = self.QUERIES + [
+            ['garlic', 'tomato', 'pasta', 'basil', 'rice'],
+            ['rice', 'lime', 'chicken', 'ginger', 'garlic'],
+            list(self.ingredients),
+        ]
+        for names in pantries:
+            for limit in (1, 2, 50):
+                self.assertSamePantry(names, limit=limit)
+            for cuisine in ('italian', 'chinese', 'thai', 'mexican'):
+                self.assertSamePantry(names, cuisine)
+        self.assertEqual(
+            [title for title, *_ in self.pantry(['garlic', 'tomato', 'pasta', 'basil'])],
+            ['Bruschetta', 'Quick Tomato Pasta', 'Pesto Pasta', 'Tomato Pasta Again', 'Tomato Pasta'],
+        )
+
+    def test_pantry_backends_agree_after_catalog_changes(self):
+        self.pantry(['garlic'])
+        self.add_recipe('Garlic Soup', 'french', 5, ['garlic'])
+        self.add_recipe('Empty Plate', 'french', 5, [])
+        Recipe.objects.get(title='Lime Rice').delete()
+        RecipeIngredient.objects.filter(recipe__title='Garlic Rice', ingredient=self.ingredients['rice']).delete()
+        for names in [['garlic'], ['garlic', 'rice', 'lime'], list(self.ingredients)]:
+            self.assertSamePantry(names)
+            self.assertSamePantry(names, 'french')
+        self.assertEqual([title for title, *_ in self.pantry(['garlic'])], ['Garlic Soup', 'Garlic Rice'])
+
+    def test_index_applies_updates(self):
+        index = get_ingredient_index()
+        recipe = Recipe.objects.get(title='Pesto Pasta')
+        recipe.cuisine = 'thai'
+        recipe.cooking_time = 5
+        recipe.save()
+        RecipeIngredient.objects.filter(recipe=recipe, ingredient=self.ingredients['pasta']).delete()
+        RecipeIngredient.objects.create(recipe=recipe, ingredient=self.ingredients['lime'])
+
+        self.assertEqual(index.sync(), 1)
+        self.assertEqual(
+            index.ingredients_of(recipe.id),
+            tuple(sorted(self.ingredients[name].id for name in ['basil', 'garlic', 'lime'])),
+        )
+        for names in self.QUERIES:
+            self.assertSameRanking(names, k=10)
+            self.assertSameRanking(names, 'thai')
+            self.assertSameRanking(names, 'italian')
+
+    def test_index_replays_changes_committed_late(self):
+        index = get_ingredient_index()
+        version = index.version
+        lime_rice = Recipe.objects.get(title='Lime Rice')
+        garlic_rice = Recipe.objects.get(title='Garlic Rice')
+
+        # A later transaction commits first, so its change id jumps over one still open
+        Recipe.objects.filter(pk=garlic_rice.pk).update(cooking_time=40)
+        RecipeCatalogChange.objects.create(id=version + 2, recipe_id=garlic_rice.pk)
+        self.assertEqual(index.sync(), 1)
+        self.assertEqual(index.version, version + 2)
+        self.assertEqual(list(index.gaps), [version + 1])
+
+        # The earlier transaction commits: its change lands below the version
+        Recipe.objects.filter(pk=lime_rice.pk).update(cooking_time=50)
+        RecipeCatalogChange.objects.create(id=version + 1, recipe_id=lime_rice.pk)
+        self.assertEqual(index.sync(), 1)
+        self.assertEqual(index.gaps, {})
+        self.assertEqual(index.version, version + 2)
+        for names in self.QUERIES:
+            self.assertSameRanking(names, k=10)
+
+    def test_gaps_expire(self):
+        index = get_ingredient_index()
+        version = index.version
+        RecipeCatalogChange.objects.create(id=version + 2, recipe_id=Recipe.objects.get(title='Garlic Rice').pk)
+        index.sync()
+        self.assertIn(version + 1, index.gaps)
+
+        # Past the timeout the missing id is taken to be a rolled back transaction
+        with override_settings(RECIPE_CATALOG_GAP_TIMEOUT=0):
+            self.assertEqual(index.sync(), 0)
+        self.assertEqual(index.gaps, {})
+
+
+    def test_views_clamp_limit_to_at_least_one(self):
+        garlic, basil = self.ingredients['garlic'].id, self.ingredients['basil'].id
+        response = self.client.get(reverse('recipes:pairs_well_with'), {'ingredients': basil, 'limit': -1})
+        self.assertEqual([item['id'] for item in response.json()['ingredients']], [garlic])
+
+        pantry = ','.join(str(self.ingredients[name].id) for name in ['garlic', 'rice', 'lime'])
+        response = self.client.get(reverse('recipes:pantry'), {'ingredients': pantry})
+        self.assertEqual(len(response.json()['recipes']), 2)
+        response = self.client.get(reverse('recipes:pantry'), {'ingredients': pantry, 'limit': -1})
+        self.assertEqual(len(response.json()['recipes']), 1)
+
+
+class IngredientNameTests(TestCase):
+
+    def test_normalize_ingredient_name(self):
+        cases = {
+            '2 Ripe Tomatoes, diced': 'tomato',
+            'Jalapeños (seeded)': 'jalapeno',
+            'jalapeño': 'jalapeno',
+            'Crème Fraîche': 'creme fraiche',
+            'brownies': 'brownie',
+            'chocolate chip cookies': 'chocolate chip cookie',
+            'pies': 'pie',
+            'berries': 'berry',
+            'fresh basil leaves': 'basil leaf',
+            'asparagus': 'asparagus',
+            '2% milk': '2% milk',
+            '1% Milk': '1% milk',
+            '1.5 chopped': '',
+        }
+        for name, key in cases.items():
+            self.assertEqual(normalize_ingredient_name(name), key, name)
+
+    def test_clean_name_keeps_casing_and_accents(self):
+        self.assertEqual(clean_ingredient_name('2 Ripe Jalapeños (seeded), diced'), 'Jalapeños')
+        self.assertEqual(clean_ingredient_name('Crème Fraîche'), 'Crème Fraîche')
+
+    def test_resolve_reuses_and_creates_ingredients(self):
+        jalapeno = Ingredient.objects.create(name='jalapeño')
+        milk = Ingredient.objects.create(name='milk')
+
+        resolved = IngredientResolver().resolve(
+            ['Jalapeños', 'crème fraîche', 'brownies', 'chocolate chip cookies', '2% milk', 'Milk', '2 eggs, beaten']
+        )
+
+        self.assertEqual(resolved['Jalapeños'], jalapeno.id)
+        self.assertEqual(resolved['Milk'], milk.id)
+        self.assertNotEqual(resolved['2% milk'], milk.id)
+        names = dict(Ingredient.objects.filter(id__in=resolved.values()).values_list('id', 'name'))
+        self.assertEqual(names[resolved['crème fraîche']], 'crème fraîche')
+        self.assertEqual(names[resolved['brownies']], 'brownies')
+        self.assertEqual(names[resolved['chocolate chip cookies']], 'chocolate chip cookies')
+        self.assertEqual(names[resolved['2% milk']], '2% milk')
+        self.assertEqual(names[resolved['2 eggs, beaten']], 'eggs')
+        # New ingredients are aliased under their key, so other spellings find them
+        self.assertEqual(IngredientAlias.objects.get(alias='brownie').ingredient_id, resolved['brownies'])
+        self.assertEqual(IngredientResolver().resolve(['Brownie', 'creme fraiche']), {
+            'Brownie': resolved['brownies'], 'creme fraiche': resolved['crème fraîche'],
+        })
+
+    def test_merge_duplicate_ingredients(self):
+        tomato = Ingredient.objects.create(name='tomato')
+        tomatoes = Ingredient.objects.create(name='Tomatoes')
+        jalapeno = Ingredient.objects.create(name='Jalapeño')
+        jalapenos = Ingredient.objects.create(name='jalapenos')
+        skim = Ingredient.objects.create(name='1% milk')
+        whole = Ingredient.objects.create(name='2% milk')
+        recipe = Recipe.objects.create(title='Salsa', cuisine='mexican', instructions='Chop.')
+        for ingredient in (tomatoes, jalapenos, skim, whole):
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient)
+
+        call_command('merge_duplicate_ingredients', stdout=StringIO())
+
+        # The most used ingredient of each group is kept
+        remaining = set(Ingredient.objects.values_list('name', flat=True))
+        self.assertEqual(remaining, {'Tomatoes', 'jalapenos', '1% milk', '2% milk'})
+        self.assertEqual(
+            set(recipe.recipeingredient_set.values_list('ingredient_id', flat=True)),
+            {tomatoes.id, jalapenos.id, skim.id, whole.id},
+        )
+        self.assertEqual(IngredientAlias.objects.get(alias='tomato').ingredient_id, tomatoes.id)
+        self.assertEqual(IngredientAlias.objects.get(alias='jalapeño').ingredient_id, jalapenos.id)
+        self.assertFalse(Ingredient.objects.filter(id__in=[tomato.id, jalapeno.id]).exists())
+
+
+class GenerateCacheTests(TestCase):
+    """Repeated selections reuse the chosen recipe but are still recorded per user"""
+
+    def setUp(self):
+        reset_ingredient_index()
+        get_generate_cache().clear()
+        self.user = get_user_model().objects.create_user('cook')
+        self.ingredients = [Ingredient.objects.create(name=name) for name in ['garlic', 'tomato', 'pasta']]
+        self.recipe = self.add_recipe('Tomato Pasta')
+        # Only local matching: no Spoonacular calls from tests
+        patcher = mock.patch.object(generator, 'get_spoonacular_recipes', return_value=[])
+        self.search = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        reset_ingredient_index()
+        get_generate_cache().clear()
+
+    def add_recipe(self, title):
+        recipe = Recipe.objects.create(title=title, cuisine='italian', cooking_time=20, instructions='Cook.')
+        for ingredient in self.ingredients:
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient)
+        return recipe
+
+    def test_cache_hit_still_records_history(self):
+        ids = [ingredient.id for ingredient in self.ingredients]
+        recipe, metadata = generate_recipe(ids, 'italian', self.user)
+        again, again_metadata = generate_recipe(list(reversed(ids)), 'italian', self.user)
+
+        self.assertEqual(self.search.call_count, 1)
+        self.assertEqual((again, again_metadata), (recipe, metadata))
+        self.assertEqual(UserRecipeHistory.objects.filter(user=self.user, recipe=recipe).count(), 2)
+        self.assertEqual(get_generate_cache().stats()['hits'], 1)
+
+    def test_deleted_recipe_is_not_served_from_cache(self):
+        ids = [ingredient.id for ingredient in self.ingredients]
+        generate_recipe(ids, 'italian', self.user)
+        self.recipe.delete()
+        replacement = self.add_recipe('Tomato Pasta Again')
+
+        recipe, _ = generate_recipe(ids, 'italian', self.user)
+        self.assertEqual(recipe, replacement)
+        self.assertEqual(self.search.call_count, 2)
+
+
+class SynthesizedRecipeTests(TestCase):
+    """One synthesized recipe per ingredient set and cuisine"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('cook')
+        self.ingredients = [Ingredient.objects.create(name=name) for name in ['garlic', 'tomato', 'basil']]
+        self.ids = [ingredient.id for ingredient in self.ingredients]
+
+    def add_legacy_recipe(self, title, is_generated=True):
+        """A recipe synthesized before fingerprints existed"""
+        recipe = Recipe.objects.create(
+            title=title, cuisine='thai', instructions='Cook.', is_generated=is_generated,
+            description='A delicious thai recipe made with garlic, tomato, basil.',
+        )
+        for ingredient in self.ingredients:
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient)
+        return recipe
+
+    def test_fingerprint_ignores_order_and_repeats(self):
+        self.assertEqual(recipe_fingerprint([3, 1, 2, 1], 'thai'), recipe_fingerprint([1, 2, 3], 'thai'))
+        self.assertNotEqual(recipe_fingerprint([1, 2, 3], 'thai'), recipe_fingerprint([1, 2, 3], 'italian'))
+        self.assertNotEqual(recipe_fingerprint([1, 2, 3], 'thai', version=1), recipe_fingerprint([1, 2, 3], 'thai', version=2))
+
+    def test_synthesis_reuses_fingerprinted_recipe(self):
+        recipe = synthesize_recipe(self.ids, 'thai')
+        self.assertEqual(recipe.fingerprint, recipe_fingerprint(self.ids, 'thai'))
+        self.assertEqual(synthesize_recipe(list(reversed(self.ids)), 'thai'), recipe)
+        self.assertNotEqual(synthesize_recipe(self.ids, 'italian'), recipe)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_dedupe_command(self):
+        keeper = self.add_legacy_recipe('Thai Garlic Tomato Basil')
+        duplicate = self.add_legacy_recipe('Thai Garlic Tomato Basil')
+        imported = self.add_legacy_recipe('Imported Thai Basil', is_generated=False)
+        UserRecipeHistory.objects.create(user=self.user, recipe=duplicate, selected_ingredients={})
+
+        call_command('dedupe_generated_recipes', '--dry-run', stdout=StringIO())
+        self.assertEqual(Recipe.objects.count(), 3)
+
+        out = StringIO()
+        call_command('dedupe_generated_recipes', stdout=out)
+        self.assertIn('Removed 1 duplicate recipes and fingerprint 1 recipes', out.getvalue())
+        self.assertQuerySetEqual(Recipe.objects.order_by('id'), [keeper, imported])
+        self.assertEqual(UserRecipeHistory.objects.get().recipe, keeper)
+        self.assertEqual(synthesize_recipe(self.ids, 'thai'), keeper)
+
+        out = StringIO()
+        call_command('dedupe_generated_recipes', stdout=out)
+        self.assertIn('Removed 0 duplicate recipes and fingerprint 0 recipes', out.getvalue())
+
+
+@override_settings(SIMILAR_RECIPES_COUNT=2, SIMILAR_RECIPES_MIN_SCORE=0.2)
+class SimilarRecipeTests(TestCase):
+    """Precomputed neighbors, kept symmetric as recipes are added"""
+
+    def setUp(self):
+        reset_ingredient_index()
+        self.ingredients = {
+            name: Ingredient.objects.create(name=name) for name in ['garlic', 'tomato', 'pasta', 'basil', 'rice', 'lime']
+        }
+        self.tomato_pasta = self.add_recipe('Tomato Pasta', ['garlic', 'tomato', 'pasta'])
+        self.bruschetta = self.add_recipe('Bruschetta', ['garlic', 'tomato', 'basil'])
+        self.pesto_pasta = self.add_recipe('Pesto Pasta', ['garlic', 'basil', 'pasta'])
+        self.lime_rice = self.add_recipe('Lime Rice', ['rice', 'lime'])
+        refresh_similar_recipes([self.tomato_pasta.id, self.bruschetta.id, self.pesto_pasta.id, self.lime_rice.id])
+
+    def tearDown(self):
+        reset_ingredient_index()
+
+    def add_recipe(self, title, ingredient_names):
+        recipe = Recipe.objects.create(title=title, cuisine='italian', difficulty='easy', instructions='Cook.')
+        for name in ingredient_names:
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=self.ingredients[name])
+        return recipe
+
+    def neighbors(self, recipe):
+        return [(link.similar.title, round(link.score, 2)) for link in SimilarRecipe.objects.filter(recipe=recipe)]
+
+    def test_refresh_stores_top_neighbors(self):
+        # Equal scores put the newer recipe first
+        self.assertEqual(self.neighbors(self.tomato_pasta), [('Pesto Pasta', 0.5), ('Bruschetta', 0.5)])
+        self.assertEqual(self.neighbors(self.pesto_pasta), [('Bruschetta', 0.5), ('Tomato Pasta', 0.5)])
+        self.assertEqual(self.neighbors(self.lime_rice), [])
+
+    def test_refresh_merges_new_recipe_into_neighbor_lists(self):
+        everything = self.add_recipe('Everything Pasta', ['garlic', 'tomato', 'pasta', 'basil'])
+        refresh_similar_recipes([everything.id])
+
+        self.assertEqual(self.neighbors(everything), [('Pesto Pasta', 0.75), ('Bruschetta', 0.75)])
+        # Tomato Pasta only lost the tie for Everything Pasta's own list
+        self.assertEqual(self.neighbors(self.tomato_pasta), [('Everything Pasta', 0.75), ('Pesto Pasta', 0.5)])
+        self.assertEqual(self.neighbors(self.bruschetta), [('Everything Pasta', 0.75), ('Pesto Pasta', 0.5)])
+        self.assertEqual(self.neighbors(self.lime_rice), [])
+
+    def test_refresh_fills_short_lists_of_weaker_neighbors(self):
+        # Lime Rice is too weak a match for the new recipe's own top two, but its list is empty
+        pantry = self.add_recipe('Pantry Bake', ['garlic', 'tomato', 'pasta', 'basil', 'rice', 'lime'])
+        refresh_similar_recipes([pantry.id])
+
+        self.assertEqual(self.neighbors(pantry), [('Pesto Pasta', 0.5), ('Bruschetta', 0.5)])
+        self.assertEqual(self.neighbors(self.lime_rice), [('Pantry Bake', 0.33)])
+        self.assertEqual(self.neighbors(self.tomato_pasta), [('Pantry Bake', 0.5), ('Pesto Pasta', 0.5)])
+
+    def test_detail_page_reads_stored_neighbors(self):
+        SimilarRecipe.objects.filter(recipe=self.tomato_pasta, similar=self.bruschetta).update(score=0.9)
+        response = self.client.get(reverse('recipes:recipe_detail', args=[self.tomato_pasta.id]))
+
+        self.assertEqual(
+            [(link.similar.title, link.score) for link in response.context['similar_recipes']],
+            [('Bruschetta', 0.9), ('Pesto Pasta', 0.5)],
+        )
+        self.assertContains(response, reverse('recipes:recipe_detail', args=[self.bruschetta.id]))
+
+
+class CooccurrenceTests(TestCase):
+    """Ingredient pairings scored against the whole selection"""
+
+    def setUp(self):
+        self.matrix = CooccurrenceMatrix()
+        for ingredient_ids in [[1, 2, 3], [1, 2], [1, 3], [4, 5], [4, 5], [6], [1, 7]]:
+            self.matrix.add(ingredient_ids)
+
+    def scores(self, selected, **kwargs):
+        return [
+            (pairing.ingredient_id, round(pairing.pmi, 3), round(pairing.lift, 3), pairing.together)
+            for pairing in self.matrix.complements(selected, **kwargs)
+        ]
+
+    def test_pairs_below_min_together_are_skipped(self):
+        self.assertEqual([pairing[0] for pairing in self.scores([1])], [2, 3])
+        self.assertIn(7, [pairing[0] for pairing in self.scores([1], min_together=1)])
+
+    def test_unseen_pairs_average_as_no_association(self):
+        # 2 never shares a recipe with 4, which counts as lift 1 (PMI 0), not lift 0
+        pairings = {pairing[0]: pairing for pairing in self.scores([1, 4])}
+        alone = {pairing[0]: pairing for pairing in self.scores([1])}
+        self.assertEqual(pairings[2][1], round(alone[2][1] / 2, 3))
+        self.assertEqual(pairings[2][2], round((alone[2][2] + 1) / 2, 3))
+        self.assertEqual([pairing[0] for pairing in self.scores([1, 4])], [5, 2, 3])
+
+    def test_limit(self):
+        self.assertEqual([pairing[0] for pairing in self.scores([1, 4], limit=1)], [5])
+        self.assertEqual(self.scores([1, 4], limit=0), [])
+        self.assertEqual(self.scores([1, 4], limit=-1), [])
+
+    def test_removed_recipes_stop_counting(self):
+        self.matrix.remove([1, 2])
+        self.assertEqual([pairing[0] for pairing in self.scores([1])], [3])
+
+
+def fake_response(status, headers=None, body=b'[]'):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = body
+    response.url = 'http://spoonacular.test/'
+    return response
+
+
+class TokenBucketTests(TestCase):
+
+    def setUp(self):
+        self.now = 1_000_000.0
+        clock = mock.patch.object(quota, 'time', mock.Mock(time=lambda: self.now))
+        clock.start()
+        self.addCleanup(clock.stop)
+        # Ten tokens refilling at one token per ten seconds
+        self.bucket = TokenBucket('tests', 10, period=100)
+
+    def test_acquire_until_denied(self):
+        self.assertTrue(self.bucket.acquire(6))
+        self.assertTrue(self.bucket.acquire(4))
+        self.assertFalse(self.bucket.acquire(0.5))
+        self.assertAlmostEqual(self.bucket.remaining(), 0)
+        self.assertEqual((self.bucket.granted, self.bucket.denied), (2, 1))
+
+    def test_tokens_refill_up_to_capacity(self):
+        self.bucket.drain()
+        self.now += 30
+        self.assertAlmostEqual(self.bucket.remaining(), 3)
+        self.assertFalse(self.bucket.acquire(4))
+        self.assertTrue(self.bucket.acquire(3))
+        self.now += 1000
+        self.assertAlmostEqual(self.bucket.remaining(), 10)
+
+    def test_charge_and_refund(self):
+        self.bucket.charge(4)
+        self.assertAlmostEqual(self.bucket.remaining(), 6)
+        self.bucket.charge(-2)
+        self.assertAlmostEqual(self.bucket.remaining(), 8)
+        # Refunds never lift the bucket past its capacity
+        self.bucket.charge(-5)
+        self.assertAlmostEqual(self.bucket.remaining(), 10)
+
+    def test_drain_denies_until_refilled(self):
+        self.bucket.drain()
+        self.assertFalse(self.bucket.acquire(1))
+        self.now += 10
+        self.assertTrue(self.bucket.acquire(1))
+
+
+@override_settings(CACHES=TEST_CACHES, SPOONACULAR_MAX_RETRIES=2, SPOONACULAR_BACKOFF_BASE=0)
+class SpoonacularQuotaTests(TestCase):
+
+    def setUp(self):
+        self.api = SpoonacularAPI()
+        self.api.quota = TokenBucket('spoonacular-tests', 10)
+        self.api.session.get = mock.Mock()
+
+    def spend(self, *args, **kwargs):
+        """Points recorded as charged for one _get call"""
+        before = spoonacular.call_stats.points_spent()
+        try:
+            self.api._get(*args, **kwargs)
+        finally:
+            self.spent = spoonacular.call_stats.points_spent() - before
+
+    def test_every_attempt_is_charged(self):
+        self.api.session.get.side_effect = [fake_response(503), fake_response(429), fake_response(200)]
+        self.spend('search', 'search', {}, points=2)
+        self.assertEqual(self.api.session.get.call_count, 3)
+        self.assertAlmostEqual(self.api.quota.remaining(), 4, places=2)
+        self.assertAlmostEqual(self.spent, 6, places=2)
+
+    def test_reported_cost_is_settled(self):
+        self.api.session.get.return_value = fake_response(200, {'X-API-Quota-Request': '3.5'})
+        self.spend('search', 'search', {}, points=1)
+        self.assertAlmostEqual(self.api.quota.remaining(), 6.5, places=2)
+        self.assertAlmostEqual(self.spent, 3.5, places=2)
+
+    def test_attempts_without_response_are_refunded(self):
+        self.api.session.get.side_effect = requests.exceptions.ConnectionError
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.spend('search', 'search', {}, points=2)
+        self.assertEqual(self.api.session.get.call_count, 3)
+        self.assertAlmostEqual(self.api.quota.remaining(), 10, places=2)
+        self.assertEqual(self.spent, 0)
+
+    def test_quota_exhausted_response_drains_and_stops_calls(self):
+        self.api.session.get.return_value = fake_response(402)
+        with self.assertRaises(QuotaExhausted):
+            self.api._get('search', 'search', {})
+        self.assertAlmostEqual(self.api.quota.remaining(), 0, places=2)
+        self.assertEqual(self.api.breaker.stats()['consecutive_failures'], 0)
+
+        with self.assertRaises(QuotaExhausted):
+            self.api._get('search', 'search', {})
+        self.assertEqual(self.api.session.get.call_count, 1)
+
+
+@override_settings(SPOONACULAR_REFRESH_AGE=3600)
+class SpoonacularImportTests(TestCase):
+    """A Spoonacular recipe is stored once and refreshed in place once stale"""
+
+    def recipe_data(self, title='Garlic Noodles', ingredients=('garlic', 'noodles')):
+        return {
+            'id': 716429,
+            'title': title,
+            'cuisine': 'chinese',
+            'instructions': 'Cook.',
+            'ready_in_minutes': 20,
+            'ingredients': [{'name': name, 'amount': 1, 'unit': 'cup'} for name in ingredients],
+        }
+
+    def ingredient_names(self, recipe):
+        return sorted(recipe.ingredients.values_list('name', flat=True))
+
+    def test_fresh_import_is_reused(self):
+        recipe = create_recipe_from_spoonacular(self.recipe_data(), [])
+        again = create_recipe_from_spoonacular(self.recipe_data(title='Renamed Noodles'), [])
+        self.assertEqual(again, recipe)
+        self.assertEqual(Recipe.objects.get().title, 'Garlic Noodles')
+
+    def test_stale_import_is_refreshed_in_place(self):
+        recipe = create_recipe_from_spoonacular(self.recipe_data(), [])
+        Recipe.objects.filter(pk=recipe.pk).update(imported_at=timezone.now() - timedelta(hours=2))
+
+        refreshed = create_recipe_from_spoonacular(self.recipe_data('Chili Noodles', ('chili', 'noodles')), [])
+        self.assertEqual(refreshed.pk, recipe.pk)
+        self.assertEqual(Recipe.objects.get().title, 'Chili Noodles')
+        self.assertEqual(self.ingredient_names(refreshed), ['chili', 'noodles'])
+        self.assertGreater(refreshed.imported_at, timezone.now() - timedelta(minutes=1))
+
+    def test_concurrent_import_is_reused(self):
+        def import_concurrently(fields, ingredient_rows, recipe=None):
+            # The other request's import commits first, then ours hits the unique spoonacular_id
+            Recipe.objects.create(title='Their Noodles', spoonacular_id=716429)
+            raise IntegrityError('UNIQUE constraint failed: recipes_recipe.spoonacular_id')
+
+        with mock.patch.object(spoonacular, 'write_recipe', side_effect=import_concurrently):
+            recipe = create_recipe_from_spoonacular(self.recipe_data(), [])
+        self.assertEqual(recipe.title, 'Their Noodles')
+
+    def test_other_integrity_errors_are_raised(self):
+        with mock.patch.object(spoonacular, 'write_recipe', side_effect=IntegrityError('NOT NULL constraint failed')):
+            with self.assertRaises(IntegrityError):
+                create_recipe_from_spoonacular(self.recipe_data(), [])
+
+
+class CircuitBreakerTests(TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        clock = mock.patch.object(resilience.time, 'monotonic', lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.breaker = CircuitBreaker('tests', failure_threshold=3, slow_call_seconds=2, reset_timeout=30)
+
+    def open_breaker(self):
+        for _ in range(3):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.consecutive_failures, 1)
+
+        self.breaker.record_success()
+        self.open_breaker()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.stats()['rejected'], 1)
+
+    def test_slow_calls_count_as_failures(self):
+        for _ in range(3):
+            self.breaker.record_success(seconds=2.5)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_half_open_trial_closes_on_success(self):
+        self.open_breaker()
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        # Only one trial goes through per interval
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_half_open_trial_reopens_on_failure(self):
+        self.open_breaker()
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.times_opened, 2)
+        self.now += 29
+        self.assertFalse(self.breaker.allow())
+        self.now += 1
+        self.assertTrue(self.breaker.allow())
+
+    def test_deadline(self):
+        deadline = Deadline(5)
+        self.assertEqual(deadline.timeout(10), 5)
+        self.assertEqual(deadline.timeout(2), 2)
+        self.now += 6
+        self.assertTrue(deadline.expired)
+        self.assertEqual(deadline.remaining(), 0)
+
+
+@override_settings(CACHES=TEST_CACHES, SPOONACULAR_MAX_RETRIES=2, SPOONACULAR_BACKOFF_MAX=8)
+class SpoonacularRetryTests(TestCase):
+
+    def setUp(self):
+        self.api = SpoonacularAPI()
+        self.api.quota = TokenBucket('spoonacular-tests', 100)
+        self.api.session.get = mock.Mock()
+        sleep = mock.patch.object(spoonacular.time, 'sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def test_retry_after_is_honoured(self):
+        self.api.session.get.side_effect = [fake_response(429, {'Retry-After': '3'}), fake_response(200)]
+        self.api._get('search', 'search', {})
+        self.sleep.assert_called_once_with(3.0)
+
+    def test_retry_after_beyond_the_cap_gives_up(self):
+        self.api.session.get.return_value = fake_response(429, {'Retry-After': '60'})
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.api._get('search', 'search', {})
+        self.assertEqual(self.api.session.get.call_count, 1)
+        self.sleep.assert_not_called()
+
+    def test_deadline_cuts_retries_short(self):
+        self.api.session.get.return_value = fake_response(503, {'Retry-After': '3'})
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.api._get('search', 'search', {}, deadline=Deadline(1))
+        self.assertEqual(self.api.session.get.call_count, 1)
+        self.sleep.assert_not_called()
+
+        self.api.session.get.reset_mock()
+        self.api.session.get.side_effect = requests.exceptions.ConnectionError
+        with mock.patch.object(spoonacular.random, 'uniform', return_value=2):
+            with self.assertRaises(requests.exceptions.Timeout):
+                self.api._get('search', 'search', {}, deadline=Deadline(1))
+        self.assertEqual(self.api.session.get.call_count, 1)
+        self.sleep.assert_not_called()
+
+
+class SpoonacularBulkDetailsTests(TransactionTestCase):
+    """
+    informationBulk against the stub server; a TransactionTestCase, since the
+    stub answers from its own threads and database connections
+    """
+
+    def setUp(self):
+        reset_ingredient_index()
+        ingredients = {name: Ingredient.objects.create(name=name) for name in ['garlic', 'tomato', 'pasta', 'rice']}
+        self.recipes = []
+        for title, names in [('Tomato Pasta', ['garlic', 'tomato', 'pasta']),
+                             ('Garlic Rice', ['garlic', 'rice']),
+                             ('Plain Pasta', ['pasta'])]:
+            recipe = Recipe.objects.create(title=title, cuisine='italian', cooking_time=20, instructions='Cook.')
+            for name in names:
+                RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredients[name], quantity='1')
+            self.recipes.append(recipe)
+
+    def tearDown(self):
+        reset_ingredient_index()
+
+    def start_stub(self, config=StubConfig()):
+        server = make_stub_server('127.0.0.1', 0, config)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        overrides = override_settings(
+            SPOONACULAR_API_KEY='test', SPOONACULAR_BASE_URL=f"http://127.0.0.1:{server.server_address[1]}",
+            SPOONACULAR_MAX_RETRIES=0, CACHES=TEST_CACHES,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        # Local memory caches outlive the settings override, so start each test empty
+        caches['spoonacular'].clear()
+        api = SpoonacularAPI()
+        api.quota = TokenBucket('spoonacular-tests', 1000)
+        api.session.get = mock.Mock(wraps=api.session.get)
+        return api
+
+    def requested_paths(self, api):
+        return [call.args[0].rsplit('/', 1)[-1] for call in api.session.get.call_args_list]
+
+    def test_bulk_details_keep_ranking_order(self):
+        api = self.start_stub()
+        recipe_ids = [SYNTHETIC_ID_OFFSET + recipe.id for recipe in reversed(self.recipes)]
+
+        details = api.get_recipes_details_bulk(recipe_ids)
+
+        self.assertEqual([recipe['id'] for recipe in details], recipe_ids)
+        self.assertEqual(details[-1]['title'], 'Tomato Pasta')
+        self.assertEqual({ingredient['name'] for ingredient in details[-1]['ingredients']}, {'garlic', 'tomato', 'pasta'})
+        self.assertEqual(self.requested_paths(api), ['informationBulk'])
+
+        # Cached payloads are not requested again
+        api.get_recipes_details_bulk(recipe_ids[:2])
+        self.assertEqual(self.requested_paths(api), ['informationBulk'])
+
+    def test_search_uses_one_bulk_call(self):
+        api = self.start_stub()
+
+        details = api.search_recipes_by_ingredients(['garlic', 'tomato'], 'italian')
+
+        self.assertEqual(details[0]['title'], 'Tomato Pasta')
+        self.assertEqual(self.requested_paths(api), ['findByIngredients', 'informationBulk'])
+
+    def test_synthetic_ids_do_not_serve_imports_back(self):
+        api = self.start_stub()
+        details = api.search_recipes_by_ingredients(['garlic', 'tomato'], 'italian')
+        self.assertEqual(details[0]['id'], SYNTHETIC_ID_OFFSET + self.recipes[0].id)
+
+        # An imported copy of a stub answer is never matched again
+        Recipe.objects.filter(id=self.recipes[1].id).update(spoonacular_id=SYNTHETIC_ID_OFFSET + self.recipes[0].id)
+        caches['spoonacular'].clear()
+        details = api.search_recipes_by_ingredients(['garlic', 'rice'], 'italian')
+        self.assertNotIn(SYNTHETIC_ID_OFFSET + self.recipes[1].id, [recipe['id'] for recipe in details])
+        self.assertEqual(api.get_recipes_details_bulk([SYNTHETIC_ID_OFFSET + self.recipes[1].id]), [])
+
+    def test_unsupported_bulk_endpoint_returns_none(self):
+        with tempfile.TemporaryDirectory() as fixtures_dir:
+            # Replaying without fixtures answers every request with a 404
+            api = self.start_stub(StubConfig(mode='replay', fixtures_dir=Path(fixtures_dir)))
+            self.assertIsNone(api.get_recipes_details_bulk([SYNTHETIC_ID_OFFSET + self.recipes[0].id]))
+
+    def test_failing_bulk_call_raises(self):
+        api = self.start_stub(StubConfig(error_rate=1, error_status=503))
+        with self.assertRaises(requests.exceptions.HTTPError):
+            api.get_recipes_details_bulk([SYNTHETIC_ID_OFFSET + self.recipes[0].id])
+
+    def test_search_falls_back_only_when_bulk_is_unsupported(self):
+        api = self.start_stub()
+        not_found = requests.Response()
+        not_found.status_code = 404
+        with mock.patch.object(api, '_fetch_details_bulk', side_effect=requests.exceptions.HTTPError(response=not_found)):
+            details = api.search_recipes_by_ingredients(['garlic', 'tomato'], 'italian')
+        self.assertEqual(details[0]['title'], 'Tomato Pasta')
+        self.assertIn('information', self.requested_paths(api))
+
+        api = self.start_stub()
+        with mock.patch.object(api, '_fetch_details_bulk', side_effect=requests.exceptions.Timeout), \
+                mock.patch.object(api, 'get_recipes_details') as per_recipe:
+            self.assertEqual(api.search_recipes_by_ingredients(['garlic', 'tomato'], 'italian'), [])
+        per_recipe.assert_not_called()
@@ -5,8 +5,11 @@ app_name = 'recipes'
 
 urlpatterns = [
     path('generate/', views.generate_recipe_view, name='generate'),
+    path('pantry/', views.pantry_view, name='pantry'),
     path('search-ingredients/', views.search_ingredients, name='search_ingredients'),
+    path('pairs-well-with/', views.pairs_well_with, name='pairs_well_with'),
     path('<int:recipe_id>/', views.recipe_detail_view, name='recipe_detail'),
     path('history/', views.history_view, name='history'),
     path('history/delete/<int:history_id>/', views.delete_history_item, name='delete_history_item'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
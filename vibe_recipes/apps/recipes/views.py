@@ -1,10 +1,19 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
+from django.urls import reverse
 from django.core.paginator import Paginator
-from .models import Ingredient, Recipe, RecipeIngredient, UserRecipeHistory
-from .services.generator import generate_recipe
+from .models import Ingredient, Recipe, RecipeIngredient, SimilarRecipe, UserRecipeHistory
+from .services.generator import generate_recipe, pantry_recipes
+from .services.cache import get_generate_cache
+from .services.index import get_ingredient_index
+from .services.ingredients import SelectedIngredients
+from .services.spoonacular import call_stats, get_api
+from .services.substitutions import get_substitution_graph
+from .services.writer import write_stats
 
 
 def generate_recipe_view(request):
@@ -19,9 +28,31 @@ def generate_recipe_view(request):
         try:
             # Convert ingredient IDs to integers
             ingredient_ids = [int(ing_id) for ing_id in selected_ingredients]
-            
+        except ValueError:
+            messages.error(request, 'Please select valid ingredients.')
+            return redirect('recipes:generate')
+        
+        # Load the selection once; the whole pipeline reuses it
+        selection = SelectedIngredients.load(ingredient_ids)
+        if selection.unknown_ids:
+            messages.error(request, 'Some selected ingredients no longer exist, please select again.')
+            return redirect('recipes:generate')
+        
+        try:
             # Generate recipe using the service
-            recipe, metadata = generate_recipe(ingredient_ids, selected_cuisine, request.user)
+            recipe, metadata = generate_recipe(selection.ids, selected_cuisine, request.user, selection=selection)
+            
+            # Keep the ranked alternatives so the detail page can offer them without recomputing
+            request.session['recipe_alternatives'] = {
+                'recipe': {
+                    'id': recipe.id,
+                    'title': recipe.title,
+                    'coverage': metadata.get('coverage', 1.0),
+                    'missing': len(metadata.get('missing_ingredients', [])),
+                    'substitutable': len(metadata.get('substitutions', {})),
+                },
+                'alternatives': metadata.get('alternatives', []),
+            }
             
             # Redirect to recipe detail page
             return redirect('recipes:recipe_detail', recipe_id=recipe.id)
@@ -49,6 +80,22 @@ def generate_recipe_view(request):
     return render(request, 'recipes/generate.html', context)
 
 
+def get_session_alternatives(request, recipe_id):
+    """
+    Return the other ranked matches from the last generate request when the
+    recipe being viewed is one of them.
+    """
+    stored = request.session.get('recipe_alternatives')
+    if not stored:
+        return []
+    
+    ranked = [stored['recipe']] + stored['alternatives']
+    if recipe_id not in [item['id'] for item in ranked]:
+        return []
+    
+    return [item for item in ranked if item['id'] != recipe_id]
+
+
 def search_ingredients(request):
     """AJAX endpoint for ingredient search"""
     query = request.GET.get('q', '').lower()
@@ -68,6 +115,71 @@ def search_ingredients(request):
     return JsonResponse({'ingredients': data})
 
 
+def pairs_well_with(request):
+    """AJAX endpoint suggesting ingredients that often share recipes with the current selection"""
+    try:
+        ingredient_ids = [
+            int(ing_id)
+            for value in request.GET.getlist('ingredients')
+            for ing_id in value.split(',') if ing_id.strip()
+        ]
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+    except ValueError:
+        return JsonResponse({'error': 'Ingredients and limit must be integers'}, status=400)
+    
+    if not ingredient_ids:
+        return JsonResponse({'ingredients': []})
+    
+    pairings = get_ingredient_index(with_cooccurrence=True).complements(
+        ingredient_ids, limit=limit, min_together=getattr(settings, 'INGREDIENT_PAIR_MIN_COUNT', 2)
+    )
+    ingredients = Ingredient.objects.in_bulk([pairing.ingredient_id for pairing in pairings])
+    
+    data = [
+        {
+            'id': pairing.ingredient_id,
+            'name': ingredients[pairing.ingredient_id].name,
+            'category': ingredients[pairing.ingredient_id].category,
+            'pmi': round(pairing.pmi, 3),
+            'lift': round(pairing.lift, 3),
+            'together': pairing.together,
+        }
+        for pairing in pairings
+        if pairing.ingredient_id in ingredients
+    ]
+    return JsonResponse({'ingredients': data})
+
+
+def pantry_view(request):
+    """JSON endpoint listing the recipes that can be cooked with only the given ingredients"""
+    try:
+        ingredient_ids = [
+            int(ing_id)
+            for value in request.GET.getlist('ingredients')
+            for ing_id in value.split(',') if ing_id.strip()
+        ]
+        limit = max(1, min(int(request.GET.get('limit', 50)), 200))
+    except ValueError:
+        return JsonResponse({'error': 'Ingredients and limit must be integers'}, status=400)
+    
+    if not ingredient_ids:
+        return JsonResponse({'error': 'Please select at least one ingredient'}, status=400)
+    
+    matches = pantry_recipes(ingredient_ids, request.GET.get('cuisine') or None, limit=limit)
+    data = [
+        {
+            'id': match.recipe.id,
+            'title': match.recipe.title,
+            'cuisine': match.recipe.cuisine,
+            'cooking_time': match.recipe.cooking_time,
+            'ingredients': match.matching,
+            'url': reverse('recipes:recipe_detail', args=[match.recipe.id]),
+        }
+        for match in matches
+    ]
+    return JsonResponse({'recipes': data})
+
+
 def recipe_detail_view(request, recipe_id):
     """Display recipe details"""
     recipe = get_object_or_404(Recipe, id=recipe_id)
@@ -81,11 +193,18 @@ def recipe_detail_view(request, recipe_id):
     # Get difficulty display name
     difficulty_display = dict(Recipe.DIFFICULTY_CHOICES).get(recipe.difficulty, recipe.difficulty.title())
     
+    # Neighbors are precomputed, so this is one indexed read
+    similar_recipes = SimilarRecipe.objects.filter(recipe=recipe).select_related('similar')[
+        :getattr(settings, 'SIMILAR_RECIPES_COUNT', 6)
+    ]
+    
     context = {
         'recipe': recipe,
         'recipe_ingredients': recipe_ingredients,
         'cuisine_display': cuisine_display,
         'difficulty_display': difficulty_display,
+        'alternatives': get_session_alternatives(request, recipe.id),
+        'similar_recipes': similar_recipes,
     }
     
     return render(request, 'recipes/recipe_detail.html', context)
@@ -121,3 +240,19 @@ def delete_history_item(request, history_id):
         return redirect('recipes:history')
     
     return redirect('recipes:history')
+
+
+@staff_member_required
+def metrics_view(request):
+    """JSON snapshot of this worker's recipe generation metrics"""
+    api = get_api()
+    return JsonResponse({
+        'generate_cache': get_generate_cache().stats(),
+        'recipe_writes': write_stats.stats(),
+        'spoonacular_calls': call_stats.stats(),
+        'spoonacular_cache': api.cache.stats(),
+        'spoonacular_breaker': api.breaker.stats(),
+        'spoonacular_searches': api.flights.stats(),
+        'spoonacular_quota': api.quota.stats(),
+        'substitution_graph': get_substitution_graph().stats(),
+    })
@@ -1,5 +1,7 @@
 import os
 from pathlib import Path
+# Cache configuration, including the Spoonacular response cache shared by all workers
+from .settings import CACHES
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -64,10 +64,3 @@ LOGGING = {
         'level': 'INFO',
     },
 }
-
-# Cache configuration (optional - for better performance)
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
-}
@@ -28,7 +28,85 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'django-insecure-qgh=9!g%#98nkz6-uv8&*mlpsd
 
 # Spoonacular API Configuration
 SPOONACULAR_API_KEY = os.getenv('SPOONACULAR_API_KEY', '62d25049b6f44ff399eddc4d0303ec51')
-SPOONACULAR_BASE_URL = 'https://api.spoonacular.com/recipes'
+SPOONACULAR_BASE_URL = os.getenv('SPOONACULAR_BASE_URL', 'https://api.spoonacular.com/recipes')
+# Fetch candidate details with one informationBulk call instead of one call per recipe
+SPOONACULAR_USE_BULK = os.getenv('SPOONACULAR_USE_BULK', 'True').lower() == 'true'
+# Imported recipes younger than this (seconds) are reused as-is instead of re-imported
+SPOONACULAR_REFRESH_AGE = int(os.getenv('SPOONACULAR_REFRESH_AGE', str(7 * 24 * 3600)))
+# Recipe detail lookups run concurrently and are dropped if not back within the deadline (seconds)
+SPOONACULAR_DETAIL_WORKERS = int(os.getenv('SPOONACULAR_DETAIL_WORKERS', '4'))
+SPOONACULAR_DETAILS_DEADLINE = float(os.getenv('SPOONACULAR_DETAILS_DEADLINE', '5'))
+# Keep-alive connection pool size, and retries with jittered exponential backoff (seconds) on 429/5xx
+SPOONACULAR_POOL_SIZE = int(os.getenv('SPOONACULAR_POOL_SIZE', '10'))
+SPOONACULAR_MAX_RETRIES = int(os.getenv('SPOONACULAR_MAX_RETRIES', '2'))
+SPOONACULAR_BACKOFF_BASE = float(os.getenv('SPOONACULAR_BACKOFF_BASE', '0.5'))
+# Backoff is capped at BACKOFF_MAX; a longer Retry-After from the server ends the call instead
+SPOONACULAR_BACKOFF_MAX = float(os.getenv('SPOONACULAR_BACKOFF_MAX', '8'))
+# Raw Spoonacular payloads are cached for these many seconds, then served stale while refreshed
+SPOONACULAR_SEARCH_CACHE_TTL = int(os.getenv('SPOONACULAR_SEARCH_CACHE_TTL', str(24 * 3600)))
+SPOONACULAR_RECIPE_CACHE_TTL = int(os.getenv('SPOONACULAR_RECIPE_CACHE_TTL', str(7 * 24 * 3600)))
+SPOONACULAR_CACHE_STALE = int(os.getenv('SPOONACULAR_CACHE_STALE', str(24 * 3600)))
+# Empty payloads (searches without results) are only cached this many seconds
+SPOONACULAR_EMPTY_CACHE_TTL = int(os.getenv('SPOONACULAR_EMPTY_CACHE_TTL', '300'))
+# Let one worker fetch a missing search while the others wait up to LOCK_WAIT seconds for its result
+SPOONACULAR_CACHE_LOCK = os.getenv('SPOONACULAR_CACHE_LOCK', 'False').lower() == 'true'
+SPOONACULAR_CACHE_LOCK_WAIT = float(os.getenv('SPOONACULAR_CACHE_LOCK_WAIT', '5'))
+# Circuit breaker: open after this many consecutive failures (calls slower than SLOW_CALL seconds
+# count as failures), then let one trial call through every RESET seconds
+SPOONACULAR_BREAKER_FAILURES = int(os.getenv('SPOONACULAR_BREAKER_FAILURES', '5'))
+SPOONACULAR_BREAKER_SLOW_CALL = float(os.getenv('SPOONACULAR_BREAKER_SLOW_CALL', '3'))
+SPOONACULAR_BREAKER_RESET = float(os.getenv('SPOONACULAR_BREAKER_RESET', '30'))
+# Daily API points shared by all workers; calls are skipped once they are spent
+SPOONACULAR_DAILY_POINTS = float(os.getenv('SPOONACULAR_DAILY_POINTS', '150'))
+
+# Caches; the file-based 'spoonacular' cache is shared by all workers on the host
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'spoonacular': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('SPOONACULAR_CACHE_DIR', str(BASE_DIR / 'cache' / 'spoonacular')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('SPOONACULAR_CACHE_MAX_ENTRIES', '10000')),
+        },
+    },
+}
+
+# Recipe matching
+RECIPE_MATCH_ALTERNATIVES = int(os.getenv('RECIPE_MATCH_ALTERNATIVES', '3'))
+# 'index' keeps an in-memory ingredient index per worker, 'database' ranks in one SQL query,
+# 'lsh' scores only the recipes a MinHash LSH over the index shortlists. 'lsh' is experimental
+# and not meant as a default: it is approximate (recall@5 measured at 0.72 for 32x2 and 0.42
+# for 64x3 on 20k recipes) without beating the exact index's latency, and each worker builds
+# it in the background (seconds on large catalogs), serving exact results until it is ready
+RECIPE_MATCHER_BACKEND = os.getenv('RECIPE_MATCHER_BACKEND', 'index')
+# LSH recall/latency knob: more bands raise recall, more rows per band shrink the shortlist
+RECIPE_LSH_BANDS = int(os.getenv('RECIPE_LSH_BANDS', '32'))
+RECIPE_LSH_ROWS = int(os.getenv('RECIPE_LSH_ROWS', '2'))
+# Similar recipes kept per recipe for the detail page, and the least Jaccard similarity shown
+SIMILAR_RECIPES_COUNT = int(os.getenv('SIMILAR_RECIPES_COUNT', '6'))
+SIMILAR_RECIPES_MIN_SCORE = float(os.getenv('SIMILAR_RECIPES_MIN_SCORE', '0.2'))
+# Recipes an ingredient pair must share before it is suggested as pairing well
+INGREDIENT_PAIR_MIN_COUNT = int(os.getenv('INGREDIENT_PAIR_MIN_COUNT', '2'))
+# Seconds catalog changes are kept for workers to replay; idle workers older than this rebuild
+RECIPE_CATALOG_CHANGE_RETENTION = int(os.getenv('RECIPE_CATALOG_CHANGE_RETENTION', '86400'))
+# Seconds a skipped change id is re-read in case its transaction commits late
+RECIPE_CATALOG_GAP_TIMEOUT = int(os.getenv('RECIPE_CATALOG_GAP_TIMEOUT', '300'))
+
+# Per-worker memo of generate_recipe results, keyed by ingredient ids + cuisine
+GENERATE_CACHE_SIZE = int(os.getenv('GENERATE_CACHE_SIZE', '1024'))
+GENERATE_CACHE_TTL = int(os.getenv('GENERATE_CACHE_TTL', '600'))  # seconds, 0 disables
+# Seconds a generate request may spend on Spoonacular; every HTTP call gets what is left of it
+GENERATE_TIME_BUDGET = float(os.getenv('GENERATE_TIME_BUDGET', '8'))
+
+# Rows per INSERT when recipes and their ingredients are bulk written
+RECIPE_WRITE_BATCH_SIZE = int(os.getenv('RECIPE_WRITE_BATCH_SIZE', '500'))
+# Seconds each worker keeps its map of normalized ingredient names and aliases
+INGREDIENT_RESOLVER_TTL = int(os.getenv('INGREDIENT_RESOLVER_TTL', '300'))
+# Longest chain of ingredient swaps suggested, and seconds each worker keeps its substitution graph
+SUBSTITUTION_MAX_HOPS = int(os.getenv('SUBSTITUTION_MAX_HOPS', '2'))
+SUBSTITUTION_GRAPH_TTL = int(os.getenv('SUBSTITUTION_GRAPH_TTL', '300'))
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'